@@ -0,0 +1,57 @@
+# Assigns the vertex weights of a 30k-vertex, 80-bone skinned geoset, once with one VertexGroup.add call per
+# (bone, weight) bucket and once with a call per vertex and bone, and checks both give the same weights.
+#
+#   blender -b --factory-startup --python benchmarks/bench_import_weights.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import *
+
+from export_mdl.classes.War3Geoset import War3Geoset
+
+bone_count = 80
+
+def skinned_geoset(vertex_count):
+    # Matrices of one to three neighbouring bones, the way a limb blends into the next
+    rng = np.random.default_rng(0)
+    geoset = War3Geoset()
+    geoset.matrices = [tuple(range(first, min(first + size, bone_count))) for first in range(bone_count) for size in (1, 2, 3)]
+    geoset.groups = rng.integers(0, len(geoset.matrices), vertex_count).tolist()
+    return geoset
+
+def bone_groups(obj):
+    obj.vertex_groups.clear()
+    return {bone_id: obj.vertex_groups.new(name="Bone_%d" % bone_id) for bone_id in range(bone_count)}
+
+def assign_bucketed(obj, geoset):
+    War3Model.assign_vertex_weights(geoset, bone_groups(obj), len(obj.data.vertices))
+
+def assign_per_vertex(obj, geoset):
+    groups = bone_groups(obj)
+    for vertex_index, group in enumerate(geoset.groups):
+        matrix = geoset.matrices[group]
+        for bone_id in matrix:
+            groups[bone_id].add([vertex_index], 1.0 / len(matrix), 'ADD')
+
+def read_weights(obj):
+    return [sorted((g.group, round(g.weight, 6)) for g in vertex.groups) for vertex in obj.data.vertices]
+
+def main():
+    reset_scene()
+    obj = grid_object("Skin", 174) # 30,276 vertices
+    geoset = skinned_geoset(len(obj.data.vertices))
+    print("Vertices: %d, bones: %d" % (len(obj.data.vertices), bone_count))
+
+    report_time("Bucketed VertexGroup.add", best_time(assign_bucketed, obj, geoset))
+    bucketed = read_weights(obj)
+    report_time("Per-vertex VertexGroup.add", best_time(assign_per_vertex, obj, geoset))
+    per_vertex = read_weights(obj)
+
+    if bucketed != per_vertex:
+        raise SystemExit("Bucketed weights differ from the per-vertex reference")
+    print("Weights are identical")
+
+main()
@@ -0,0 +1,57 @@
+# Writes a 500k-vertex model with the buffered MDL writer and with a line-by-line reference writer
+# (one file.write per line, floats formatted one at a time by f2s), and checks both files are identical.
+#
+#   blender -b --factory-startup --python benchmarks/bench_mdl_write.py
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import *
+
+from export_mdl import export_mdl, utils
+
+class LineWriter(export_mdl.MDLWriter):
+    # Hands every line to the file on its own, like the writer did before it buffered output
+    def emit(self, text):
+        self.file.write(text)
+
+    def write_lines(self, lines):
+        for line in lines:
+            self.write(line)
+
+def write_reference(model, path):
+    writer_class = export_mdl.MDLWriter
+    numpy = utils.np
+    export_mdl.MDLWriter = LineWriter
+    utils.np = None # format_vectors falls back to f2s
+    try:
+        export_mdl.write_model(model, path)
+    finally:
+        export_mdl.MDLWriter = writer_class
+        utils.np = numpy
+
+def read_body(path):
+    with open(path) as file:
+        return file.readlines()[1:] # The first line holds the export date
+
+def main():
+    reset_scene()
+    grid_object("Grid", 708) # 501,264 vertices
+    model = build_model()
+    print("Vertices: %d" % sum(len(geoset.vertices) for geoset in model.geosets))
+
+    folder = tempfile.mkdtemp()
+    buffered_path = os.path.join(folder, "buffered.mdl")
+    reference_path = os.path.join(folder, "reference.mdl")
+
+    report_time("Buffered writer", best_time(export_mdl.write_model, model, buffered_path))
+    report_time("Line-by-line reference writer", best_time(write_reference, model, reference_path))
+
+    if read_body(buffered_path) != read_body(reference_path):
+        raise SystemExit("Buffered output differs from the reference writer")
+    print("Output is identical")
+
+main()
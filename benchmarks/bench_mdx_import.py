@@ -0,0 +1,55 @@
+# Parses the same 62,500-vertex model from MDX and from MDL, and checks both give the same geometry.
+#
+#   blender -b --factory-startup --python benchmarks/bench_mdx_import.py
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import *
+
+from export_mdl import export_mdl, export_mdx
+from export_mdl.import_mdl import MDLParser
+from export_mdl.import_mdx import MDXParser
+
+def parse_mdx(path):
+    model = War3Model(bpy.context)
+    parser = MDXParser(path)
+    try:
+        parser.parse(model)
+    finally:
+        parser.close()
+    return model
+
+def parse_mdl(path):
+    model = War3Model(bpy.context)
+    MDLParser(path).parse(model)
+    return model
+
+def main():
+    reset_scene()
+    grid_object("Grid", 250) # 62,500 vertices, within the 16 bit MDX index limit
+    model = build_model()
+
+    folder = tempfile.mkdtemp()
+    mdx_path = os.path.join(folder, "grid.mdx")
+    mdl_path = os.path.join(folder, "grid.mdl")
+    export_mdx.write_model(model, mdx_path)
+    export_mdl.write_model(model, mdl_path)
+
+    report_time("MDX parse", best_time(parse_mdx, mdx_path))
+    report_time("MDL parse", best_time(parse_mdl, mdl_path))
+
+    mdx_geoset = parse_mdx(mdx_path).geosets[0]
+    mdl_geoset = parse_mdl(mdl_path).geosets[0]
+    for attribute in ('positions', 'normals', 'uvs'):
+        difference = np.abs(np.asarray(getattr(mdx_geoset, attribute)) - np.asarray(getattr(mdl_geoset, attribute))).max()
+        if difference > 1e-4:
+            raise SystemExit("MDX and MDL %s differ by %g" % (attribute, difference))
+    if list(mdx_geoset.triangles) != list(mdl_geoset.triangles):
+        raise SystemExit("MDX and MDL triangles differ")
+    print("Geometry is identical")
+
+main()
@@ -0,0 +1,71 @@
+# Reduces 10k-key translation and rotation tracks with War3AnimationCurve.optimize, and checks that the
+# reduced tracks stay within the tolerance of the original ones at every frame.
+#
+#   blender -b --factory-startup --python benchmarks/bench_optimize_curves.py
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import *
+
+from export_mdl.classes.War3AnimationCurve import War3AnimationCurve
+from export_mdl.classes.War3AnimationSequence import War3AnimationSequence, War3SequenceList
+
+key_count = 10000
+tolerance = 0.05
+f2ms = 1000 / 30
+
+def translation_keys(rng):
+    # A slow wave with a random walk on top, so long stretches reduce well and others barely at all
+    t = np.arange(key_count) / 100
+    wave = np.column_stack((np.sin(t), np.cos(t * 0.7), np.sin(t * 0.3)))
+    return (wave + np.cumsum(rng.normal(0, 0.01, (key_count, 3)), axis=0)).tolist()
+
+def rotation_keys(rng):
+    angles = np.arange(key_count) / 200 + np.cumsum(rng.normal(0, 0.002, key_count))
+    axes = np.column_stack((np.sin(angles * 0.1), np.cos(angles * 0.1), np.full(key_count, 0.5)))
+    axes /= np.linalg.norm(axes, axis=1)[:, None]
+    return np.column_stack((np.cos(angles / 2), axes * np.sin(angles / 2)[:, None])).tolist()
+
+def make_curve(type, keys):
+    curve = War3AnimationCurve()
+    curve.type = type
+    curve.set_keys([int(frame * f2ms) for frame in range(key_count)], keys)
+    return curve
+
+def time_optimize(type, keys, sequences, repeat=3):
+    # Lowest time of a few runs, each on a fresh copy of the track
+    times = []
+    for i in range(repeat):
+        curve = make_curve(type, keys)
+        start = time.perf_counter()
+        curve.optimize(tolerance, sequences)
+        times.append(time.perf_counter() - start)
+    return min(times), curve
+
+def deviation(type, original, reduced, sequences):
+    frames = np.array(original.times) # Every frame had a key
+    a = original.evaluate(frames, sequences)
+    b = reduced.evaluate(frames, sequences)
+    if type == 'Rotation':
+        return (1 - np.abs(np.einsum('ij,ij->i', a, b))).max()
+    return np.linalg.norm(a - b, axis=1).max()
+
+def main():
+    rng = np.random.default_rng(0)
+    half = key_count // 2
+    sequences = War3SequenceList([War3AnimationSequence("Stand", 0, (half - 1) * f2ms), War3AnimationSequence("Walk", half * f2ms, (key_count - 1) * f2ms)], f2ms)
+
+    for type, keys in (('Translation', translation_keys(rng)), ('Rotation', rotation_keys(rng))):
+        seconds, reduced = time_optimize(type, keys, sequences)
+        report_time("%s, %d -> %d keys" % (type, key_count, len(reduced)), seconds)
+
+        error = deviation(type, make_curve(type, keys), reduced, sequences)
+        if error > tolerance + 1e-9:
+            raise SystemExit("%s deviates by %g, more than the tolerance of %g" % (type, error, tolerance))
+        print("Largest deviation %.4f (tolerance %g)" % (error, tolerance))
+
+main()
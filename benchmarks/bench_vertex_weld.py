@@ -0,0 +1,49 @@
+# Builds geosets from grids of about 10k, 100k and 1M triangle corners, once with the np.unique weld in
+# from_scene and once with the per-triangle path that welds corner by corner through War3Geoset.add_vertex,
+# and checks both give the same vertices and triangles.
+#
+#   blender -b --factory-startup --python benchmarks/bench_vertex_weld.py
+
+import importlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import *
+
+from export_mdl.classes.War3MeshCache import mesh_cache
+
+model_module = importlib.import_module(War3Model.__module__)
+
+grid_sizes = (42, 130, 409) # 10,086, 99,846 and 998,784 corners
+
+def build_unique():
+    mesh_cache.clear() # Every run triangulates, like the per-triangle path
+    return build_model()
+
+def build_per_triangle():
+    numpy = model_module.np
+    model_module.np = None
+    try:
+        return build_model()
+    finally:
+        model_module.np = numpy
+
+def main():
+    for size in grid_sizes:
+        reset_scene()
+        grid_object("Grid", size)
+        corners = 6 * (size - 1) ** 2
+        repeat = 3 if corners < 1000000 else 1
+
+        report_time("np.unique weld, %d corners" % corners, best_time(build_unique, repeat=repeat))
+        report_time("Per-triangle weld, %d corners" % corners, best_time(build_per_triangle, repeat=repeat))
+
+        unique = build_unique().geosets[0]
+        per_triangle = build_per_triangle().geosets[0]
+        if unique.vertices != per_triangle.vertices or unique.triangles != per_triangle.triangles:
+            raise SystemExit("The np.unique weld differs from the per-triangle path at %d corners" % corners)
+        print("Vertices: %d, geosets are identical" % len(unique.vertices))
+
+main()
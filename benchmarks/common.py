@@ -0,0 +1,67 @@
+# Shared setup for the benchmarks. They run inside Blender, with the add-on imported from this checkout:
+#
+#   blender -b --factory-startup --python benchmarks/bench_mdl_write.py
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bpy
+import numpy as np
+
+import export_mdl
+
+from export_mdl.classes.War3Model import War3Model
+from export_mdl.classes.War3ExportSettings import War3ExportSettings
+
+class Reporter:
+    # Stands in for the operator the export and import functions report to
+    def report(self, type, message):
+        print("%s: %s" % (", ".join(sorted(type)), message))
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    if not hasattr(bpy.types.Scene, "mdl_sequences"):
+        export_mdl.register()
+
+def grid_object(name, size):
+    # A flat size x size vertex grid of quads
+    mesh = bpy.data.meshes.new(name)
+    xs, ys = np.meshgrid(np.arange(size), np.arange(size))
+    coords = np.column_stack((xs.ravel(), ys.ravel(), np.zeros(size * size))) / size
+    corners = (np.arange(size - 1)[None, :] + np.arange(size - 1)[:, None] * size).ravel()
+    quads = np.column_stack((corners, corners + 1, corners + size + 1, corners + size))
+
+    mesh.vertices.add(len(coords))
+    mesh.vertices.foreach_set('co', coords.ravel())
+    mesh.loops.add(quads.size)
+    mesh.loops.foreach_set('vertex_index', quads.ravel())
+    mesh.polygons.add(len(quads))
+    mesh.polygons.foreach_set('loop_start', np.arange(0, quads.size, 4))
+    mesh.polygons.foreach_set('loop_total', np.full(len(quads), 4))
+    mesh.update(calc_edges=True)
+    mesh.uv_layers.new(name="UV")
+
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    return obj
+
+def build_model(settings=None):
+    context = bpy.context
+    model = War3Model(context)
+    model.from_scene(context, settings or War3ExportSettings(), Reporter().report)
+    return model
+
+def best_time(function, *args, repeat=3):
+    # Lowest wall time of a few runs, in seconds
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def report_time(label, seconds):
+    print("%-48s %9.3f s" % (label, seconds))
@@ -42,10 +42,12 @@ import shutil
 def export_menu_func(self, context):
     self.layout.operator_context = 'INVOKE_DEFAULT'
     self.layout.operator(operators.WAR3_OT_export_mdl.WAR3_OT_export_mdl.bl_idname, text="Warcraft MDL (.mdl)")  
+    self.layout.operator(operators.WAR3_OT_export_mdx.WAR3_OT_export_mdx.bl_idname, text="Warcraft MDX (.mdx)")
 
 def import_menu_func(self, context):
     self.layout.operator_context = 'INVOKE_DEFAULT'
     self.layout.operator(operators.WAR3_OT_import_mdl.WAR3_OT_import_mdl.bl_idname, text="Warcraft MDL (.mdl)")  
+    self.layout.operator(operators.WAR3_OT_import_mdx.WAR3_OT_import_mdx.bl_idname, text="Warcraft MDX (.mdx)")
 
 def register():
     from bpy.utils import register_class
@@ -57,6 +59,12 @@ def register():
     bpy.types.TOPBAR_MT_file_import.append(import_menu_func)
     bpy.types.VIEW3D_MT_add.append(ui.WAR3_MT_add_object.menu_func)
     
+    from .classes.War3MeshCache import update_mesh_cache, clear_mesh_cache
+    bpy.app.handlers.depsgraph_update_post.append(update_mesh_cache)
+    bpy.app.handlers.load_post.append(clear_mesh_cache)
+    bpy.app.handlers.undo_post.append(clear_mesh_cache)
+    bpy.app.handlers.redo_post.append(clear_mesh_cache)
+    
     presets_path = os.path.join(bpy.utils.user_resource('SCRIPTS', path="presets"), "mdl_exporter")
     emitters_path = os.path.join(presets_path, "emitters")
     
@@ -73,6 +81,13 @@ def unregister():
     bpy.types.TOPBAR_MT_file_export.remove(export_menu_func)
     bpy.types.TOPBAR_MT_file_import.remove(import_menu_func)
     bpy.types.VIEW3D_MT_add.remove(ui.WAR3_MT_add_object.menu_func)
+    
+    from .classes.War3MeshCache import mesh_cache, update_mesh_cache, clear_mesh_cache
+    bpy.app.handlers.depsgraph_update_post.remove(update_mesh_cache)
+    bpy.app.handlers.load_post.remove(clear_mesh_cache)
+    bpy.app.handlers.undo_post.remove(clear_mesh_cache)
+    bpy.app.handlers.redo_post.remove(clear_mesh_cache)
+    mesh_cache.clear()
 
     for cls in reversed(properties.classes + operators.classes + ui.classes):
         unregister_class(cls)
@@ -1,18 +1,114 @@
 import bpy
 
 import math
+from array import array
+from bisect import bisect_left, bisect_right
+from types import MappingProxyType
 from mathutils import Quaternion, Matrix, Euler, Vector
 
 from ..utils import *
+from .War3AnimationSequence import War3SequenceList
+
+mdx_interpolation_ids = {
+    'DontInterp': 0,
+    'Linear': 1,
+    'Hermite': 2,
+    'Bezier': 3
+}
+
+def lerp(a, b, u):
+    return a + (b - a) * u[:, None]
+    
+def slerp(a, b, u):
+    # Row-wise Quaternion.slerp: shortest path, falling back to lerp for nearly equal rotations
+    cosom = np.einsum('ij,ij->i', a, b)
+    b = np.where((cosom < 0)[:, None], -b, b)
+    cosom = np.abs(cosom)
+    omega = np.arccos(np.minimum(cosom, 1))
+    sinom = np.sin(omega)
+    close = 1 - cosom <= 0.0001
+    safe = np.where(close, 1, sinom)
+    w0 = np.where(close, 1 - u, np.sin((1 - u) * omega) / safe)
+    w1 = np.where(close, u, np.sin(u * omega) / safe)
+    return a * w0[:, None] + b * w1[:, None]
+    
+def squad(a, out_tan, in_tan, b, u):
+    return slerp(slerp(a, b, u), slerp(out_tan, in_tan, u), 2 * u * (1 - u))
+    
+def bezier(a, out_tan, in_tan, b, u):
+    v = (1 - u)[:, None]
+    u = u[:, None]
+    return a * v**3 + out_tan * 3 * u * v**2 + in_tan * 3 * u**2 * v + b * u**3
+    
+def hermite(a, out_tan, in_tan, b, u):
+    u = u[:, None]
+    return a * (2 * u**3 - 3 * u**2 + 1) + out_tan * (u**3 - 2 * u**2 + u) + in_tan * (u**3 - u**2) + b * (-2 * u**3 + 3 * u**2)
 
 class War3AnimationCurve:
+    # Keys are stored as a sorted array of integer millisecond times, with the values (and tangents, if any)
+    # packed row by row into flat arrays of 'width' floats. Big rigs keep tens of thousands of these alive.
+    __slots__ = ('interpolation', 'global_sequence', 'type', 'times', 'values', 'in_tans', 'out_tans', 'width', '_key_hash')
+    
     def __init__(self):
         self.interpolation = 'Linear'
         self.global_sequence = -1
         self.type = 'Default'
-        self.keyframes = {}
-        self.handles_right = {}
-        self.handles_left = {}
+        self.times = array('i')
+        self.values = array('d')
+        self.in_tans = array('d')
+        self.out_tans = array('d')
+        self.width = 0
+        self._key_hash = None
+        
+    def set_keys(self, times, values, in_tans=None, out_tans=None):
+        # Replaces all keys. Keys don't need to be sorted; if two share a time, the last one wins.
+        order = {}
+        for i, time in enumerate(times):
+            order[int(time)] = i
+        times = sorted(order)
+        rows = [order[time] for time in times]
+        
+        self.times = array('i', times)
+        self.width = len(values[rows[0]]) if len(rows) else 0
+        self.values = array('d', [x for i in rows for x in values[i]])
+        self.in_tans = array('d', [x for i in rows for x in in_tans[i]]) if in_tans is not None else array('d')
+        self.out_tans = array('d', [x for i in rows for x in out_tans[i]]) if out_tans is not None else array('d')
+        self._key_hash = None
+        
+    def __len__(self):
+        return len(self.times)
+        
+    def key(self, i):
+        return tuple(self.values[i*self.width:(i+1)*self.width])
+        
+    def in_tan(self, i):
+        if not len(self.in_tans):
+            return self.key(i)
+        return tuple(self.in_tans[i*self.width:(i+1)*self.width])
+        
+    def out_tan(self, i):
+        if not len(self.out_tans):
+            return self.key(i)
+        return tuple(self.out_tans[i*self.width:(i+1)*self.width])
+        
+    @property
+    def keyframes(self):
+        # Read-only {time: value} snapshots, mostly for debugging. Keys are changed through set_keys.
+        return MappingProxyType({time: self.key(i) for i, time in enumerate(self.times)})
+        
+    @property
+    def handles_left(self):
+        return MappingProxyType({time: self.in_tan(i) for i, time in enumerate(self.times)})
+        
+    @property
+    def handles_right(self):
+        return MappingProxyType({time: self.out_tan(i) for i, time in enumerate(self.times)})
+        
+    def rows(self, packed):
+        # One (n, width) matrix of a packed array - a NumPy array if available, otherwise a list of tuples
+        if np is not None:
+            return np.array(packed, dtype=np.float64).reshape(-1, max(self.width, 1))
+        return [tuple(packed[i:i+self.width]) for i in range(0, len(packed), self.width)]
     
     @staticmethod
     def from_fcurve(fcurves, data_path, sequences, scale=1):
@@ -33,7 +129,9 @@ class War3AnimationCurve:
         elif 'visibility' in data_path.lower() or 'hide_render' in data_path.lower():
             curve.type = 'Boolean'
 
-        f2ms = 1000 / bpy.context.scene.render.fps
+        if not isinstance(sequences, War3SequenceList):
+            sequences = War3SequenceList(sequences, 1000 / bpy.context.scene.render.fps)
+        f2ms = sequences.f2ms
         
         for fcurve in fcurves.values():
             if len(fcurve.keyframe_points):
@@ -47,74 +145,188 @@ class War3AnimationCurve:
                     curve.global_sequence = max(curve.global_sequence, int(fcurve.range()[1] * f2ms))
                     
             for keyframe in fcurve.keyframe_points:
-                frame = keyframe.co[0] * f2ms
-                for sequence in sequences:
-                    if (frame >= sequence.start and frame <= sequence.end) or curve.global_sequence > 0:
-                        frames.add(keyframe.co[0])
-                        break
+                if curve.global_sequence > 0 or sequences.contains(keyframe.co[0] * f2ms):
+                    frames.add(keyframe.co[0])
          
         # We want start and end keyframes for each sequence. Make sure not to do this for events and global sequences, though!
         if curve.global_sequence < 0 and curve.type in {'Rotation', 'Translation', 'Scaling'}:
-            for sequence in sequences:
-                frames.add(round(sequence.start / f2ms))
-                frames.add(round(sequence.end / f2ms))
+            for start, end in sequences.frame_ranges:
+                frames.add(start)
+                frames.add(end)
             
         if curve.type == 'Boolean' or curve.type == 'EventTrack':
             curve.interpolation = 'DontInterp'
          
-        curve.curves = []
+        # Channels are sorted by array index once, instead of once per frame
+        curves = [fcurves[key] for key in sorted(fcurves.keys(), key=lambda x: x[1])]
+        
+        frames = sorted(frames)
+        use_handles = curve.interpolation == 'Bezier'
+        
+        channels = []
+        handles_left = []
+        handles_right = []
+        for fcurve in curves:
+            channels.append(War3AnimationCurve.sample(fcurve, frames, scale))
+            if use_handles:
+                handles_left.append(War3AnimationCurve.sample(fcurve, [frame - 1 for frame in frames], scale))
+                handles_right.append(War3AnimationCurve.sample(fcurve, [frame + 1 for frame in frames], scale))
         
-        for frame in frames:
-            values = []
-            handle_left = []
-            handle_right = []
+        is_euler = 'rotation' in data_path and 'quaternion' not in data_path # Warcraft 3 only uses quaternions!
+        
+        keys = []
+        in_tans = []
+        out_tans = []
+        for i, frame in enumerate(frames):
+            values = [channel[i] for channel in channels]
             
-            keys = fcurves.keys()
-            keys = sorted(keys, key=lambda x: x[1])
-            for key in keys:
-                curve.curves.append(fcurves[key])
-                value = fcurves[key].evaluate(frame)
-                values.append(value * scale)
-                
-                if 'color' in data_path:
-                    values = values[::-1] # Colors are stored in reverse
-                    
-                if 'hide_render' in data_path:
-                    values = [1 - v for v in values] # Hide_Render is the opposite of visibility!
+            if 'color' in data_path:
+                values = values[::-1] # Colors are stored in reverse
                 
-                if curve.interpolation == 'Bezier':
-                    hl = fcurves[key].evaluate(frame-1)
-                    hr = fcurves[key].evaluate(frame+1)
-                    handle_left.append(hl)
-                    handle_right.append(hr)
+            if 'hide_render' in data_path:
+                values = [1 - v for v in values] # Hide_Render is the opposite of visibility!
             
-            if 'rotation' in data_path and 'quaternion' not in data_path: # Warcraft 3 only uses quaternions!
-                curve.keyframes[frame] = tuple(Euler(values).to_quaternion())
+            if is_euler:
+                keys.append(tuple(Euler(values).to_quaternion()))
             else:
-                curve.keyframes[frame] = tuple(values)
+                keys.append(tuple(values))
                 
-            if curve.interpolation == 'Bezier':
-                if 'rotation' in data_path and 'quaternion' not in data_path:
-                    curve.handles_left[frame] = tuple(Euler(math.radians(x) for x in handle_left).to_quaternion())
-                    curve.handles_right[frame] = tuple(Euler(math.radians(x) for x in handle_right).to_quaternion())
+            if use_handles:
+                handle_left = [channel[i] for channel in handles_left]
+                handle_right = [channel[i] for channel in handles_right]
+                if 'color' in data_path:
+                    handle_left = handle_left[::-1]
+                    handle_right = handle_right[::-1]
+                if is_euler:
+                    in_tans.append(tuple(Euler(math.radians(x) for x in handle_left).to_quaternion()))
+                    out_tans.append(tuple(Euler(math.radians(x) for x in handle_right).to_quaternion()))
                 else:
-                    curve.handles_right[frame] = tuple(handle_right)
-                    curve.handles_left[frame] = tuple(handle_right)
+                    in_tans.append(tuple(handle_left))
+                    out_tans.append(tuple(handle_right))
 
+        curve.set_keys([int(frame * f2ms) for frame in frames], keys, in_tans if use_handles else None, out_tans if use_handles else None)
         return curve
 
-    @staticmethod # This was used just for debug/validation purposes, to be removed
-    def bezier_curve(p0, p0_out, p1_in, p1, t):
-        nt = (1 - t)
-        return nt*nt*nt*p0 + 3 * t * nt*nt * p0_out + 3*t*t*nt * p1_in + t*t*t*p1
+    @staticmethod
+    def sample(fcurve, frames, scale=1):
+        # Evaluates one F-curve at every frame. Frames that sit exactly on a keyframe are read
+        # straight from the keyframe points, unless modifiers could change the result.
+        keys = {}
+        if not len(fcurve.modifiers):
+            co = [0.0] * (len(fcurve.keyframe_points) * 2)
+            fcurve.keyframe_points.foreach_get('co', co)
+            keys = dict(zip(co[0::2], co[1::2]))
+            
+        evaluate = fcurve.evaluate
+        return [(keys[frame] if frame in keys else evaluate(frame)) * scale for frame in frames]
 
+    def evaluate(self, times, sequences, default=None):
+        # Samples the track at the given millisecond times the way the game does: only the keys inside the
+        # sequence (or global sequence) that contains a time count, and times outside every sequence, or in a
+        # sequence without keys, get the default value. Without sequences, all keys form a single span.
+        # Returns an (n, width) array, or a list of tuples without NumPy.
+        width = self.width or (len(default) if default is not None else 1)
+        if default is None:
+            default = (0,) * width
+        if np is None:
+            return [self.evaluate_at(time, sequences, default) for time in times]
+            
+        times = np.asarray(times, dtype=np.float64)
+        result = np.tile(np.array(default, dtype=np.float64), (len(times), 1))
+        if not len(self.times):
+            return result
+            
+        key_times = np.array(self.times, dtype=np.float64)
+        if sequences is None:
+            first = np.zeros(len(times), dtype=np.int64)
+            last = np.full(len(times), len(key_times) - 1)
+        elif self.global_sequence > 0:
+            times = np.mod(times, self.global_sequence)
+            first = np.zeros(len(times), dtype=np.int64)
+            last = np.full(len(times), len(key_times) - 1)
+        else:
+            first = np.full(len(times), -1)
+            last = np.full(len(times), -1)
+            for start, end in reversed(sequences.time_ranges): # The first sequence that contains a time wins
+                inside = (times >= start) & (times <= end)
+                first[inside] = bisect_left(self.times, start)
+                last[inside] = bisect_right(self.times, end) - 1
+        valid = (first >= 0) & (first <= last)
+        if not valid.any():
+            return result
+        times, first, last = times[valid], first[valid], last[valid]
+        
+        i0 = np.clip(np.searchsorted(key_times, times, side='right') - 1, first, last)
+        i1 = np.minimum(i0 + 1, last)
+        span = key_times[i1] - key_times[i0]
+        u = np.clip((times - key_times[i0]) / np.where(span > 0, span, 1), 0, 1)
+        
+        values = self.rows(self.values)
+        if self.interpolation == 'DontInterp' or self.type == 'EventTrack':
+            result[valid] = values[i0]
+        elif self.interpolation == 'Linear' or not len(self.in_tans):
+            result[valid] = slerp(values[i0], values[i1], u) if self.type == 'Rotation' else lerp(values[i0], values[i1], u)
+        else:
+            out_tans = self.rows(self.out_tans)[i0]
+            in_tans = self.rows(self.in_tans)[i1]
+            if self.type == 'Rotation':
+                result[valid] = squad(values[i0], out_tans, in_tans, values[i1], u)
+            elif self.interpolation == 'Bezier':
+                result[valid] = bezier(values[i0], out_tans, in_tans, values[i1], u)
+            else:
+                result[valid] = hermite(values[i0], out_tans, in_tans, values[i1], u)
+        return result
+        
+    def evaluate_at(self, time, sequences, default):
+        # Single time version of evaluate, used without NumPy
+        if sequences is None:
+            first, last = 0, len(self.times) - 1
+        elif self.global_sequence > 0:
+            time = time % self.global_sequence
+            first, last = 0, len(self.times) - 1
+        else:
+            first, last = 0, -1
+            for start, end in sequences.time_ranges:
+                if start <= time <= end:
+                    first, last = bisect_left(self.times, start), bisect_right(self.times, end) - 1
+                    break
+        if first > last:
+            return tuple(default)
+            
+        i0 = min(max(bisect_right(self.times, time) - 1, first), last)
+        i1 = min(i0 + 1, last)
+        span = self.times[i1] - self.times[i0]
+        u = min(max((time - self.times[i0]) / span, 0), 1) if span > 0 else 0
+        
+        a = self.key(i0)
+        b = self.key(i1)
+        if self.interpolation == 'DontInterp' or self.type == 'EventTrack':
+            return a
+        elif self.interpolation == 'Linear' or not len(self.in_tans):
+            if self.type == 'Rotation':
+                return tuple(Quaternion(a).slerp(Quaternion(b), u))
+            return tuple(x + (y - x) * u for x, y in zip(a, b))
+        elif self.type == 'Rotation':
+            q = Quaternion(a).slerp(Quaternion(b), u)
+            tangent = Quaternion(self.out_tan(i0)).slerp(Quaternion(self.in_tan(i1)), u)
+            return tuple(q.slerp(tangent, 2 * u * (1 - u)))
+        elif self.interpolation == 'Bezier':
+            v = 1 - u
+            weights = (v * v * v, 3 * u * v * v, 3 * u * u * v, u * u * u)
+        else:
+            weights = (2 * u**3 - 3 * u**2 + 1, u**3 - 2 * u**2 + u, u**3 - u**2, -2 * u**3 + 3 * u**2)
+        return tuple(sum(w * x for w, x in zip(weights, points)) for points in zip(a, self.out_tan(i0), self.in_tan(i1), b))
+        
     def to_fcurves(self, target, anim_data_obj, data_path, full_data_path, matrix=None):
-        num_channels = 1
-        for keyframe in self.keyframes:
-            frame = int(round(keyframe * bpy.context.scene.render.fps / 1000))
-            value = self.keyframes[keyframe]
+        # Creates the action F-curves directly and fills all keyframes of a channel with foreach_set,
+        # instead of inserting (and then searching for) one key at a time.
+        fps = bpy.context.scene.render.fps
+        use_handles = self.interpolation == 'Bezier' # Hermite is not supported yet, should convert to bezier handles
 
-            num_channels = len(value)
+        keys = {}
+        for i, keyframe in enumerate(self.times):
+            value = self.key(i)
+            hl = hr = None
 
             if 'color' in data_path:
                 value = tuple(reversed(value))
@@ -125,164 +337,327 @@ class War3AnimationCurve:
             if matrix is not None:
                 value = matrix @ Vector(value)
 
-            if len(value) == 1:
-                value = value[0]
+            if use_handles:
+                hl = self.in_tan(i)
+                hr = self.out_tan(i)
 
-            setattr(target, data_path, value)
-            target.keyframe_insert(data_path, frame=frame)
+                if matrix is not None and self.type != 'Rotation':
+                    hl = matrix @ Vector(hl)
+                    hr = matrix @ Vector(hr)
+
+            # Millisecond rounding can put two keys on the same frame - the last one wins, same as with keyframe_insert
+            keys[int(round(keyframe * fps / 1000))] = (value, hl, hr)
+
+        if not len(keys):
+            return
+
+        try:
+            full_data_path = target.path_from_id(data_path)
+        except ValueError:
+            pass # The target can't resolve its own path, use the given one
+
+        if anim_data_obj.animation_data is None:
+            anim_data_obj.animation_data_create()
+        anim_data = anim_data_obj.animation_data
+        if anim_data.action is None:
+            anim_data.action = bpy.data.actions.new(name="%sAction" % anim_data_obj.name)
+        fcurves = anim_data.action.fcurves
+        # Pose bone channels go in a group named after the bone, the same as keyframe_insert does
+        group = target.name if isinstance(target, bpy.types.PoseBone) else ""
+
+        frames = sorted(keys)
+        num_keys = len(frames)
+        num_channels = len(keys[frames[0]][0])
+
+        interpolation = {
+            'DontInterp': 0, # CONSTANT
+            'Bezier': 2, # BEZIER
+            'Hermite': 1, # LINEAR
+            'Linear': 1 # LINEAR
+        }[self.interpolation]
 
         for channel in range(num_channels):
-            curve = anim_data_obj.animation_data.action.fcurves.find(full_data_path, index=channel)
+            curve = fcurves.find(full_data_path, index=channel)
+            if curve is not None:
+                fcurves.remove(curve) # Each path is imported once, start from a clean curve
+            curve = fcurves.new(full_data_path, index=channel, action_group=group)
 
-            if curve is None:
-                print("Missing curve for object %s, data path %s, channel %d" % (anim_data_obj.name, data_path, channel))
-                continue
             if self.global_sequence != -1:
                 curve.modifiers.new('CYCLES')
-            i = 0
-            for frame in self.keyframes:
-                frame_num = frame * bpy.context.scene.render.fps / 1000.0
-                # Sometimes blender fails to create another frame (for instance, millisecond rounding error might cause two frames to overlap).
-                # Because of this, we have to search for the right frame.
-                while abs(curve.keyframe_points[i].co[0] - frame_num) > 0.001 and i < len(curve.keyframe_points)-1:
-                    i +=1
-                curve_frame = curve.keyframe_points[i]
-                curve_frame.interpolation = {
-                    'DontInterp':'CONSTANT',
-                    'Bezier':'BEZIER',
-                    'Hermite':'LINEAR',
-                    'Linear':'LINEAR'
-                }[self.interpolation]
-
-                if self.interpolation in {'Bezier', 'Hermite'}:
-                    hl = self.handles_left[frame]
-                    hr = self.handles_right[frame]
-
-                    if matrix is not None and self.type != 'Rotation':
-                        hl = matrix @ Vector(hl)
-                        hr = matrix @ Vector(hr)
-
-                    if self.interpolation == 'Hermite':
-                        continue # Not supported yet, should convert to bezier handles
-
-                    def lerp(a, b, t):
-                        return a + (b - a) * t
-
-                    if i == 0:
-                        curve_frame.handle_left = (curve_frame.co[0] - 20, hl[channel]) 
-                    else:
-                        hl_frame = lerp(curve.keyframe_points[i-1].co[0], curve_frame.co[0], 0.5)
-                        curve_frame.handle_left = (hl_frame, hl[channel])
-
-                    if i+1 < len(curve.keyframe_points):
-                        hr_frame = lerp(curve_frame.co[0], curve.keyframe_points[i+1].co[0], 0.5)
-                        curve_frame.handle_right = (hr_frame, hr[channel])
-                    else:
-                        curve_frame.handle_right = (curve_frame.co[0] + 20, hr[channel])
-
-    def split_segment(self, start, end, tolerance):
-        n = float(end[0] - start[0])
-        error = -1
-        frame = 0
-        # print('Start: %d, End: %d, Range: %f' % (start[0], end[0], n))
-        
-        for i in (i for i in range(start[0], end[0]) if i in self.keyframes.keys()):
-            middle = self.keyframes[i]
-            distance = 0
-            t = max(0, min(1, float(i - start[0]) / n)) # Interpolation factor
-            if self.type == 'Translation' or self.type == 'Scaling':
-                a = Vector(start[1])
-                b = Vector(middle)
-                c = Vector(end[1])
-                delta = b - a.lerp(c, t)
-                distance = delta.magnitude # Just the linear distance, for now
-            elif self.type == 'Rotation':
-                distance = 1 - Quaternion(middle).dot(Quaternion(start[1]).slerp(Quaternion(end[1]), t)) # Spherical distance in the range of 0-2
-                
-            if distance > error:
-                error = distance
-                frame = i
-                
-        if error > 0 and error > tolerance:
-            middle = (frame, self.keyframes[frame])
-            result = [middle]
-            if frame != start[0] and frame != end[0]: # Prevents infinite recursion
-                result += self.split_segment(start, middle, tolerance)
-                result += self.split_segment(middle, end, tolerance)
-                return result
-                
-        return []
+
+            co = []
+            for frame in frames:
+                co += (frame, keys[frame][0][channel])
+
+            curve.keyframe_points.add(num_keys)
+            curve.keyframe_points.foreach_set('co', co)
+            curve.keyframe_points.foreach_set('interpolation', [interpolation] * num_keys)
+
+            if use_handles:
+                handles_left = []
+                handles_right = []
+                for i, frame in enumerate(frames):
+                    value, hl, hr = keys[frame]
+                    hl_frame = frame - 20 if i == 0 else (frames[i-1] + frame) * 0.5
+                    hr_frame = frame + 20 if i + 1 == num_keys else (frame + frames[i+1]) * 0.5
+                    handles_left += (hl_frame, hl[channel])
+                    handles_right += (hr_frame, hr[channel])
+
+                curve.keyframe_points.foreach_set('handle_left_type', [0] * num_keys) # FREE, so the handles are kept as they are
+                curve.keyframe_points.foreach_set('handle_right_type', [0] * num_keys)
+                curve.keyframe_points.foreach_set('handle_left', handles_left)
+                curve.keyframe_points.foreach_set('handle_right', handles_right)
+
+            curve.update()
+
+    def segment(self, start, end, out_tan=None, in_tan=None):
+        # A copy of just the keys start and end, with new tangents between them if given
+        w = self.width
+        curve = War3AnimationCurve()
+        curve.interpolation = self.interpolation
+        curve.type = self.type
+        curve.width = w
+        curve.times = array('i', (self.times[start], self.times[end]))
+        curve.values = self.values[start*w:(start+1)*w] + self.values[end*w:(end+1)*w]
+        if out_tan is not None:
+            curve.out_tans = array('d', tuple(out_tan) * 2)
+            curve.in_tans = array('d', tuple(in_tan) * 2)
+        elif len(self.in_tans):
+            curve.out_tans = self.out_tans[start*w:(start+1)*w] + self.out_tans[end*w:(end+1)*w]
+            curve.in_tans = self.in_tans[start*w:(start+1)*w] + self.in_tans[end*w:(end+1)*w]
+        return curve
+        
+    def deviations(self, a, b):
+        # Row by row distance between two sets of samples: 1 - |cos| of the half angle for rotations, Euclidean otherwise
+        if np is not None:
+            if self.type == 'Rotation':
+                return 1 - np.abs(np.einsum('ij,ij->i', a, b))
+            return np.linalg.norm(a - b, axis=1)
+        if self.type == 'Rotation':
+            return [1 - abs(sum(x * y for x, y in zip(p, q))) for p, q in zip(a, b)]
+        return [math.sqrt(sum((x - y) ** 2 for x, y in zip(p, q))) for p, q in zip(a, b)]
     
-    def optimize(self, tolerance, sequences):
+    def fit_bezier(self, start, end, times, reference):
+        # Least squares fit of the OutTan of the start key and the InTan of the end key to the reference samples
+        # at the given times, with both keys fixed. Returns None unless there are more samples than the two
+        # tangents, since any fit would otherwise pass through them exactly and hide how far it strays in between.
+        if len(times) <= 2:
+            return None
+        t0 = self.times[start]
+        n = float(self.times[end] - t0)
+        p0 = self.key(start)
+        p3 = self.key(end)
         
-        f2ms = 1000 / bpy.context.scene.render.fps
+        if np is not None:
+            u = (np.asarray(times) - t0) / n
+            v = 1 - u
+            basis = np.stack((3 * u * v * v, 3 * u * u * v), axis=1)
+            residual = np.asarray(reference) - np.outer(v ** 3, p0) - np.outer(u ** 3, p3)
+            tangents, residuals, rank, singular = np.linalg.lstsq(basis, residual, rcond=None)
+            if rank < 2:
+                return None
+            return tuple(tangents[0].tolist()), tuple(tangents[1].tolist())
+            
+        a11 = a12 = a22 = 0
+        rhs1 = [0] * len(p0)
+        rhs2 = [0] * len(p0)
+        for time, sample in zip(times, reference):
+            u = (time - t0) / n
+            v = 1 - u
+            b1 = 3 * u * v * v
+            b2 = 3 * u * u * v
+            for j, (y, a, d) in enumerate(zip(sample, p0, p3)):
+                r = y - v ** 3 * a - u ** 3 * d
+                rhs1[j] += b1 * r
+                rhs2[j] += b2 * r
+            a11 += b1 * b1
+            a12 += b1 * b2
+            a22 += b2 * b2
+            
+        det = a11 * a22 - a12 * a12
+        if abs(det) <= 1e-12:
+            return None
+        out_tan = tuple((a22 * r1 - a12 * r2) / det for r1, r2 in zip(rhs1, rhs2))
+        in_tan = tuple((a11 * r2 - a12 * r1) / det for r1, r2 in zip(rhs1, rhs2))
+        return out_tan, in_tan
+    
+    def optimize(self, tolerance, sequences, fit_bezier=False):
         
-        if self.interpolation == 'Bezier':
-            self.interpolation = 'Linear' # This feature doesn't support bezier as of right now
+        if not isinstance(sequences, War3SequenceList):
+            sequences = War3SequenceList(sequences, 1000 / bpy.context.scene.render.fps)
            
-        print('Before: %d' % len(self.keyframes))
-        
-        newKeys = []
-        for sequence in sequences:
-            start = int(round(sequence.start / f2ms))
-            end = int(round(sequence.end / f2ms))
-            newKeys += [(start, self.keyframes[start]), (end, self.keyframes[end])]
-            newKeys += self.split_segment((start, self.keyframes[start]) , (end, self.keyframes[end]), tolerance)
-        
-        self.keyframes.clear()
-        self.keyframes.update(newKeys)
-        print('After: %d' % len(self.keyframes))
-
-    def transform_rot(self, matrix):
-        for frame in self.keyframes.keys():
-            axis, angle = Quaternion(self.keyframes[frame]).to_axis_angle()
+        print('Before: %d' % len(self.times))
+        
+        num_keys = len(self.times)
+        spans = []
+        for start, end in sequences.time_ranges:
+            spans.append((bisect_left(self.times, start), bisect_left(self.times, end)))
+            
+        # The reduced track is compared against the original at every frame and every key of each sequence,
+        # not just at the keys, so a fit can't drift away from the motion between the keys it passes through.
+        sample_times = set()
+        for start, end in spans:
+            if end < num_keys:
+                t0 = self.times[start]
+                t1 = self.times[end]
+                count = int((t1 - t0) / sequences.f2ms)
+                sample_times.update(t0 + i * sequences.f2ms for i in range(1, count + 1) if t0 + i * sequences.f2ms < t1)
+                sample_times.update(self.times[start:end+1])
+        sample_times = sorted(sample_times)
+        reference = self.evaluate(sample_times, None)
+        
+        fit_bezier = fit_bezier and self.interpolation == 'Bezier' and self.type != 'Rotation'
+        if self.interpolation == 'Bezier' and not fit_bezier:
+            self.interpolation = 'Linear' # Reduced against straight lines, so the tangents no longer apply
+        
+        # Douglas-Peucker over all sequences at once, with an explicit stack instead of recursion.
+        # In Bezier mode each segment is a fitted cubic instead of a straight line.
+        keep = set()
+        in_tans = {}
+        out_tans = {}
+        stack = []
+        for start, end in spans:
+            keep.update(i for i in (start, end) if i < num_keys)
+            stack.append((start, end))
+            
+        while stack:
+            start, end = stack.pop()
+            if end >= num_keys:
+                continue
+            if end - start < 2:
+                if fit_bezier: # Nothing to remove, so the original tangents fit best
+                    out_tans[start] = self.out_tan(start)
+                    in_tans[end] = self.in_tan(end)
+                continue
+                
+            lo = bisect_right(sample_times, self.times[start])
+            hi = bisect_left(sample_times, self.times[end])
+            times = sample_times[lo:hi]
+            
+            out_tan = in_tan = None
+            if fit_bezier:
+                tangents = self.fit_bezier(start, end, times, reference[lo:hi])
+                if tangents is None: # No more samples than unknowns, so the fit can't be trusted - keep the middle key
+                    middle = (start + end) // 2
+                    keep.add(middle)
+                    stack.append((start, middle))
+                    stack.append((middle, end))
+                    continue
+                out_tan, in_tan = tangents
+                
+            errors = self.deviations(reference[lo:hi], self.segment(start, end, out_tan, in_tan).evaluate(times, None))
+            worst = int(np.argmax(errors)) if np is not None else max(range(len(errors)), key=errors.__getitem__)
+            if errors[worst] > tolerance:
+                # Split at the key closest to where the segment strays the most
+                middle = bisect_left(self.times, times[worst], start + 1, end - 1)
+                if middle > start + 1 and times[worst] - self.times[middle - 1] < self.times[middle] - times[worst]:
+                    middle -= 1
+                keep.add(middle)
+                stack.append((start, middle))
+                stack.append((middle, end))
+                continue
+                    
+            if fit_bezier:
+                out_tans[start] = out_tan
+                in_tans[end] = in_tan
+        
+        rows = sorted(keep)
+        if fit_bezier:
+            # Sequence boundaries only have a segment on one side
+            self.set_keys([self.times[i] for i in rows], [self.key(i) for i in rows],
+                          [in_tans.get(i, self.key(i)) for i in rows], [out_tans.get(i, self.key(i)) for i in rows])
+        elif self.interpolation == 'Hermite':
+            self.set_keys([self.times[i] for i in rows], [self.key(i) for i in rows], [self.in_tan(i) for i in rows], [self.out_tan(i) for i in rows])
+        else:
+            self.set_keys([self.times[i] for i in rows], [self.key(i) for i in rows])
+        print('After: %d' % len(self.times))
+
+    def packed_arrays(self):
+        # The value array plus the tangent arrays, if the curve has them
+        names = ['values']
+        if self.interpolation == 'Bezier' and len(self.in_tans):
+            names += ['in_tans', 'out_tans']
+        return [name for name in names if len(getattr(self, name))]
+        
+    def transform_rot(self, *matrices):
+        # Rotates the axis of every key by each matrix in turn, with the matrices composed up front.
+        # Like Vector.rotate, only the normalized 3x3 part of each matrix is used.
+        rotation = Matrix.Identity(3)
+        for matrix in matrices:
+            rotation = matrix.to_3x3().normalized() @ rotation
             
-            axis.rotate(matrix)
-            quat = Quaternion(axis, angle)
-            quat.normalize()
+        for name in self.packed_arrays():
+            if np is not None:
+                quats = self.rows(getattr(self, name))
+                quats /= np.linalg.norm(quats, axis=1)[:, None]
+                sin_half = np.linalg.norm(quats[:, 1:], axis=1)
+                axes = np.where((sin_half < 0.0001)[:, None], (1.0, 0.0, 0.0), quats[:, 1:] / np.maximum(sin_half, 0.0001)[:, None]) # Same fallback axis as to_axis_angle
+                axes = axes @ np.array(rotation, dtype=np.float64).T
+                axes /= np.linalg.norm(axes, axis=1)[:, None]
+                quats[:, 1:] = axes * sin_half[:, None]
+                setattr(self, name, array('d', quats.ravel().tolist()))
+            else:
+                packed = array('d')
+                for row in self.rows(getattr(self, name)):
+                    axis, angle = Quaternion(row).to_axis_angle()
+                    
+                    axis = rotation @ axis
+                    quat = Quaternion(axis, angle)
+                    quat.normalize()
+                    
+                    packed.extend(quat)
+                setattr(self, name, packed)
+        self._key_hash = None
             
-            self.keyframes[frame] = tuple(quat)
+    def transform_vec(self, *matrices):
+        # Applies each matrix in turn, composed into one affine transform before touching the keys
+        transform = Matrix.Identity(4)
+        for matrix in matrices:
+            transform = matrix.to_4x4() @ transform
             
-    def transform_vec(self, matrix):
-        for frame in self.keyframes.keys():
-            self.keyframes[frame] = tuple(matrix @ Vector(self.keyframes[frame]))
-            if self.interpolation == 'Bezier':
-                self.handles_right[frame] = tuple(matrix @ Vector(self.handles_right[frame]))
-                self.handles_left[frame] = tuple(matrix @ Vector(self.handles_left[frame]))
+        for name in self.packed_arrays():
+            if np is not None:
+                affine = np.array(transform, dtype=np.float64)
+                vectors = self.rows(getattr(self, name)) @ affine[:3, :3].T + affine[:3, 3]
+                setattr(self, name, array('d', vectors.ravel().tolist()))
+            else:
+                packed = array('d')
+                for row in self.rows(getattr(self, name)):
+                    packed.extend(transform @ Vector(row))
+                setattr(self, name, packed)
+        self._key_hash = None
             
         
     def write_mdl(self, name, writer, model):
     
-        f2ms = 1000 / bpy.context.scene.render.fps
-    
-        writer.begin_scope(name, "%d" % len(self.keyframes))
+        writer.begin_scope(name, "%d" % len(self.times))
         if self.type != 'EventTrack':
             writer.write(self.interpolation)
         if self.global_sequence > 0:
-            writer.write("GlobalSeqId %d" % model.global_seqs.index(self.global_sequence))
+            writer.write("GlobalSeqId %d" % model.global_seq_ids[self.global_sequence])
             
-        for frame in sorted(self.keyframes.keys()):
-            n = len(self.keyframes[frame])
+        for i, time in enumerate(self.times):
+            n = self.width
             line = "%s"
             if n > 1:
                 line = "{ %s" % ('%s, ' * (n-1))
                 line += "%s }"
             
             if self.type == 'EventTrack':
-                writer.write("%d" % (frame * f2ms))
+                writer.write("%d" % time)
             else:
-                keyframe = self.keyframes[frame]
+                keyframe = self.key(i)
                 
                 if self.type == 'Rotation':
                     keyframe = keyframe[1:] + keyframe[:1] # MDL quaternions must be on the form XYZW
                 
                 value = line % tuple(f2s(rnd(x)) for x in keyframe)
-                writer.write("%d: %s" % (frame * f2ms, value))
+                writer.write("%d: %s" % (time, value))
 
                     
                 if self.interpolation == 'Bezier':
-                    hl = self.handles_left[frame]
-                    hr = self.handles_right[frame]
+                    hl = self.in_tan(i)
+                    hr = self.out_tan(i)
                     
                     if self.type == 'Rotation':
                         hl = hl[1:]+hl[:1]
@@ -297,32 +672,29 @@ class War3AnimationCurve:
         # This is used for outputting the particle emitter width/length animations.
         # It's mostly a copy paste of 'write_mdl' and can be obviously "improved".
         
-        f2ms = 1000 / bpy.context.scene.render.fps
-    
-        writer.begin_scope(name, "%d" % len(self.keyframes))
+        writer.begin_scope(name, "%d" % len(self.times))
         if self.type != 'EventTrack':
             writer.write(self.interpolation)
         if self.global_sequence > 0:
-            writer.write("GlobalSeqId %d" % model.global_seqs.index(self.global_sequence))
+            writer.write("GlobalSeqId %d" % model.global_seq_ids[self.global_sequence])
             
-        for frame in sorted(self.keyframes.keys()):
-            n = len(self.keyframes[frame])
+        for i, time in enumerate(self.times):
             line = "%s"
             if self.type == 'EventTrack':
-                writer.write("%d" % (frame * f2ms))
+                writer.write("%d" % time)
             else:
-                keyframe = self.keyframes[frame]
+                keyframe = self.key(i)
                 
                 if self.type == 'Rotation':
                     keyframe = keyframe[1:] + keyframe[:1] # MDL quaternions must be on the form XYZW
                 
                 value = line % f2s(rnd(keyframe[index]*base_value))
-                writer.write("%d: %s" % (frame * f2ms, value))
+                writer.write("%d: %s" % (time, value))
 
                     
                 if self.interpolation == 'Bezier':
-                    hl = self.handles_left[frame]
-                    hr = self.handles_right[frame]
+                    hl = self.in_tan(i)
+                    hr = self.out_tan(i)
                     
                     if self.type == 'Rotation':
                         hl = hl[1:]+hl[:1]
@@ -334,8 +706,80 @@ class War3AnimationCurve:
         writer.end_scope()
         
 
-    def write_mdx(self, model, writer):
-        pass
+    def write_mdx(self, tag, writer, model, channel=None, base_value=1):
+        # Writes the curve as an MDX track chunk. 'channel' and 'base_value' have the same meaning as 
+        # 'index' and 'base_value' in write_mdl_one_channel, and are used for the emitter width/length.
+        
+        times = self.times
+        global_sequence_id = model.global_seq_ids[self.global_sequence] if self.global_sequence > 0 else -1
+        
+        writer.write_tag(tag)
+        
+        if self.type == 'EventTrack':
+            writer.pack('Ii', len(times), global_sequence_id)
+            writer.write_array('I', times)
+            return
+            
+        writer.pack('IIi', len(times), mdx_interpolation_ids[self.interpolation], global_sequence_id)
+        
+        if not len(times):
+            return
+            
+        def channels(value):
+            if self.type == 'Rotation':
+                value = value[1:] + value[:1] # MDX quaternions are XYZW, same as MDL
+            if channel is not None:
+                value = (value[channel] * base_value,)
+            return tuple(rnd(x) for x in value)
+            
+        has_tangents = self.interpolation in {'Bezier', 'Hermite'}
+        values = []
+        for i, time in enumerate(times):
+            values.append(time)
+            values += channels(self.key(i))
+            if has_tangents:
+                values += channels(self.in_tan(i))
+                values += channels(self.out_tan(i))
+                
+        n = len(channels(self.key(0)))
+        key_format = 'i%df' % (n * 3 if has_tangents else n)
+        writer.pack(key_format * len(times), *values)
+        
+    def rounded_keys(self):
+        # Key values at the precision they are written with
+        return [tuple(rnd(x) for x in self.key(i)) for i in range(len(self.times))]
+        
+    def constant_value(self):
+        # The value shared by every key, or None if the track changes
+        values = set(self.rounded_keys())
+        return values.pop() if len(values) == 1 else None
+        
+    def covers(self, sequences):
+        # True if every sequence has at least one key, so a static value can stand in for the whole track
+        if self.global_sequence > 0:
+            return True
+        return all(bisect_left(self.times, start) < bisect_right(self.times, end) for start, end in sequences.time_ranges)
+        
+    def remove_redundant_keys(self, sequences):
+        # Drops keys that repeat their neighbours without changing the interpolated result.
+        # The first and last key of every sequence are kept, so no sequence falls back to the default value.
+        num_keys = len(self.times)
+        if self.type == 'EventTrack' or self.interpolation not in {'DontInterp', 'Linear'} or num_keys < 3:
+            return
+            
+        ranges = [(0, num_keys - 1)] if self.global_sequence > 0 else [(bisect_left(self.times, start), bisect_right(self.times, end) - 1) for start, end in sequences.time_ranges]
+        protected = set(i for first, last in ranges if first <= last for i in (first, last))
+        
+        values = self.rounded_keys()
+        rows = []
+        for i in range(num_keys):
+            if i == 0 or i in protected or values[i] != values[i-1]:
+                rows.append(i)
+            elif self.interpolation == 'Linear' and (i + 1 == num_keys or values[i] != values[i+1]):
+                rows.append(i) # A linear key that ends a flat stretch still anchors the next ramp
+                
+        if len(rows) < num_keys:
+            self.set_keys([self.times[i] for i in rows], [self.key(i) for i in rows])
         
     def __eq__(self, other):
         if isinstance(self, other.__class__):
@@ -343,10 +787,10 @@ class War3AnimationCurve:
                 return False
             if self.global_sequence != other.global_sequence:
                 return False
-            if len(self.keyframes) != len(other.keyframes):
+            if len(self.times) != len(other.times):
                 return False
                 
-            return self.keyframes == other.keyframes and self.handles_left == other.handles_left and self.handles_right == other.handles_right
+            return self.times == other.times and self.values == other.values and self.in_tans == other.in_tans and self.out_tans == other.out_tans
             
         return NotImplemented
     
@@ -354,19 +798,22 @@ class War3AnimationCurve:
         return not self.__eq__(other)
         
     def __hash__(self):
-        values = [self.interpolation, self.global_sequence, self.type]
-        values.append(tuple(sorted(self.keyframes.items())))
-        values.append(tuple(sorted(self.handles_left.items())))
-        values.append(tuple(sorted(self.handles_right.items())))
-        return hash(tuple(values))
+        # Hashing the keys is the expensive part, so it's cached until the keys change
+        if self._key_hash is None:
+            self._key_hash = hash((self.times.tobytes(), self.values.tobytes(), self.in_tans.tobytes(), self.out_tans.tobytes()))
+        return hash((self.interpolation, self.global_sequence, self.type, self._key_hash))
                 
     @staticmethod
-    def get(anim_data, data_path, num_indices, sequences, scale=1):
+    def get(anim_data, data_path, num_indices, sequences, scale=1, find_fcurve=None):
+        # find_fcurve(action, data_path, index) replaces action.fcurves.find, see War3Model.find_fcurve
         curves = {}
    
         if anim_data and anim_data.action:
             for index in range(num_indices):
-                curve = anim_data.action.fcurves.find(data_path, index=index)
+                if find_fcurve is not None:
+                    curve = find_fcurve(anim_data.action, data_path, index)
+                else:
+                    curve = anim_data.action.fcurves.find(data_path, index=index)
                 if curve is not None:
                     curves[(data_path.split('.')[-1], index)] = curve # For now, i'm just interested in the type, not the whole data path. Hence, the split returns the name after the last dot. 
             
@@ -1,3 +1,5 @@
+from bisect import bisect_right
+
 class War3AnimationSequence:
     def __init__(self, name, start, end, non_looping=False, movement_speed=270):
         self.name = name
@@ -5,4 +7,28 @@ class War3AnimationSequence:
         self.end = end
         self.non_looping = non_looping
         self.movement_speed = movement_speed
-        self.rarity = 0
\ No newline at end of file
+        self.rarity = 0
+
+class War3SequenceList(list):
+    # Sequences sorted by start, with a merged interval index for time lookups
+    def __init__(self, sequences, f2ms):
+        super().__init__(sorted(sequences, key=lambda x: x.start))
+        self.f2ms = f2ms
+        # (start, end) in frames for each sequence, used for the boundary keyframes
+        self.frame_ranges = [(int(round(s.start / f2ms)), int(round(s.end / f2ms))) for s in self]
+        # The same boundaries as integer millisecond key times
+        self.time_ranges = [(int(start * f2ms), int(end * f2ms)) for start, end in self.frame_ranges]
+        
+        # Overlapping sequences are merged, so a single bisect answers containment
+        self.starts = []
+        self.ends = []
+        for sequence in self:
+            if self.ends and sequence.start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], sequence.end)
+            else:
+                self.starts.append(sequence.start)
+                self.ends.append(sequence.end)
+                
+    def contains(self, time):
+        i = bisect_right(self.starts, time) - 1
+        return i >= 0 and time <= self.ends[i]
@@ -5,4 +5,5 @@ class War3ExportSettings:
         self.global_matrix = Matrix()
         self.use_selection = False
         self.optimize_animation = False
-        self.optimize_tolerance = 0.05
\ No newline at end of file
+        self.optimize_tolerance = 0.05
+        self.optimize_bezier = False
\ No newline at end of file
@@ -1,8 +1,18 @@
+from array import array
+
 class War3Geoset:
     def __init__(self):
         self.vertices = []
+        self.vertex_map = {} # Vertex tuple -> index into self.vertices, so welding doesn't have to scan the list
         self.triangles = []
         self.matrices = []
+        self.matrix_map = {} # Bone group tuple -> index into self.matrices
+        self.bones = set() # Every bone name used by self.matrices
+        # Flat per-attribute columns filled by the importers instead of per-vertex tuples
+        self.positions = array('f')
+        self.normals = array('f')
+        self.uvs = array('f')
+        self.groups = array('i')
         self.objects = []
         self.min_extent = None
         self.max_extent = None
@@ -10,6 +20,24 @@ class War3Geoset:
         self.material_id = 0
         self.geoset_anim = None
         
+    def add_vertex(self, vertex):
+        index = self.vertex_map.get(vertex)
+        if index is None:
+            index = len(self.vertices)
+            self.vertex_map[vertex] = index
+            self.vertices.append(vertex)
+        return index
+        
+    def add_matrix(self, groups):
+        groups = tuple(groups)
+        index = self.matrix_map.get(groups)
+        if index is None:
+            index = len(self.matrices)
+            self.matrix_map[groups] = index
+            self.matrices.append(groups)
+            self.bones.update(groups)
+        return index
+        
     def __eq__(self, other):
         if isinstance(self, other.__class__):
             return self.mat_name == other.mat_name and self.geoset_anim == other.geoset_anim
@@ -2,4 +2,5 @@ from mathutils import Matrix
 
 class War3ImportSettings:
     def __init__(self):
-        self.global_matrix = Matrix()
\ No newline at end of file
+        self.global_matrix = Matrix()
+        self.convert_to_quads = True
\ No newline at end of file
@@ -36,11 +36,7 @@ class War3Material:
                 if layer_settings.texture_type == '36':
                     layer.replaceable_id = layer_settings.replaceable_id
 
-            if texture in model.textures:
-                layer.texture_id = model.textures.index(texture)
-            else:
-                model.textures.append(texture)
-                layer.texture_id = len(model.textures) - 1
+            layer.texture_id = model.textures.add(texture)
                 
             layer.filter_mode   = layer_settings.filter_mode
             layer.unshaded      = layer_settings.unshaded
@@ -48,7 +44,7 @@ class War3Material:
             layer.no_depth_test = layer_settings.no_depth_test
             layer.no_depth_set  = layer_settings.no_depth_set
             layer.alpha_value   = layer_settings.alpha
-            layer.alpha_anim    = War3AnimationCurve.get(mat.animation_data, 'mdl_layers[%d].alpha' % i, 1, model.sequences) # get_curve(mat, {'mdl_layers[%d].alpha' % i})
+            layer.alpha_anim    = model.get_curve(mat.animation_data, 'mdl_layers[%d].alpha' % i, 1) # get_curve(mat, {'mdl_layers[%d].alpha' % i})
             
             if layer.alpha_anim is not None:
                 model.register_global_sequence(layer.alpha_anim)
@@ -56,7 +52,7 @@ class War3Material:
             if mat.use_nodes:
                 uv_node = mat.node_tree.nodes.get(layer_settings.name)
                 if uv_node is not None and mat.node_tree.animation_data is not None:
-                    layer.texture_anim = War3TextureAnim.get(mat.node_tree.animation_data, uv_node, model.sequences)
+                    layer.texture_anim = War3TextureAnim.get(mat.node_tree.animation_data, uv_node, model)
                     if layer.texture_anim is not None:
                         model.register_global_sequence(layer.texture_anim.translation)
                         model.register_global_sequence(layer.texture_anim.rotation)
@@ -82,4 +78,13 @@ class War3Material:
         return hash(self.name)
         
     def write_mdl(fw):
-        pass
\ No newline at end of file
+        pass
+        
+    def write_mdx(self, model, writer):
+        writer.begin_inclusive()
+        writer.pack('iI', self.priority_plane, 0x1 if self.use_const_color else 0)
+        writer.write_tag(b'LAYS')
+        writer.pack('I', len(self.layers))
+        for layer in self.layers:
+            layer.write_mdx(model, writer)
+        writer.end_inclusive()
\ No newline at end of file
@@ -1,3 +1,13 @@
+mdx_filter_mode_ids = {
+    'None': 0,
+    'Transparent': 1,
+    'Blend': 2,
+    'Additive': 3,
+    'AddAlpha': 4,
+    'Modulate': 5,
+    'Modulate2x': 6
+}
+
 class War3MaterialLayer:
     def __init__(self):
         self.texture_id = 0
@@ -13,6 +23,29 @@ class War3MaterialLayer:
         self.no_depth_test = False
         self.no_depth_set = False
         
+    def write_mdx(self, model, writer):
+        flags = 0
+        if self.unshaded:
+            flags |= 0x1
+        if self.two_sided:
+            flags |= 0x10
+        if self.unfogged:
+            flags |= 0x20
+        if self.no_depth_test:
+            flags |= 0x40
+        if self.no_depth_set:
+            flags |= 0x80
+            
+        texture_anim_id = 0xFFFFFFFF
+        if self.texture_anim is not None:
+            texture_anim_id = model.tvertex_anim_ids[self.texture_anim]
+            
+        writer.begin_inclusive()
+        writer.pack('IIIIIf', mdx_filter_mode_ids[self.filter_mode], flags, self.texture_id if self.texture_id is not None else 0, texture_anim_id, 0, self.alpha_value)
+        if self.alpha_anim is not None:
+            self.alpha_anim.write_mdx(b'KMTA', writer, model)
+        writer.end_inclusive()
+        
     def __eq__(self, other):
         if isinstance(self, other.__class__):
             return self.__dict__ == other.__dict__
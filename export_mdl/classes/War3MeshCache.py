@@ -0,0 +1,90 @@
+import bpy
+import math
+
+from bpy.app.handlers import persistent
+
+class War3MeshCache:
+    # Triangulated, local-space mesh arrays, keyed by mesh datablock and modifier fingerprint. Objects that
+    # share a mesh and modifier stack are evaluated once, and entries are kept between exports until a
+    # depsgraph update reports new geometry for the mesh or an object using it.
+    def __init__(self):
+        self.entries = {} # Mesh pointer -> {fingerprint: arrays}
+        self.updating = False # Set while the exporter evaluates a mesh, so its temporary modifier is not taken for an edit
+
+    @staticmethod
+    def fingerprint(obj):
+        # Everything besides the mesh data that shapes the evaluated local-space mesh. Returns None when the
+        # result also depends on other data (armatures, hooks, shape keys, textures...), which is never cached.
+        if obj.type != 'MESH' or obj.parent_type not in {'OBJECT', 'BONE'} or obj.data.shape_keys is not None:
+            return None
+
+        # Cached normals are rebuilt from the placed triangles, which only stays true to Blender's for objects
+        # that are rotated and uniformly scaled. Stretched or sheared objects are prepared with their matrix.
+        axes = [[row[i] for row in obj.matrix_world[:3]] for i in range(3)]
+        lengths = [math.sqrt(sum(x * x for x in axis)) for axis in axes]
+        if max(lengths) - min(lengths) > 1e-5 * max(lengths):
+            return None
+        if any(abs(sum(x * y for x, y in zip(axes[i], axes[j]))) > 1e-5 * lengths[i] * lengths[j] for i, j in ((0, 1), (0, 2), (1, 2))):
+            return None
+
+        modifiers = []
+        for mod in obj.modifiers:
+            if mod.type == 'ARMATURE':
+                return None # The exporter reads bone weights from the mesh, even when no armature is set
+            settings = [mod.type]
+            for prop in mod.bl_rna.properties:
+                if prop.identifier in {'rna_type', 'name'}:
+                    continue
+                if prop.type == 'POINTER':
+                    return None # Points at other data, or may once it is set
+                value = getattr(mod, prop.identifier)
+                if value is None or isinstance(value, (bool, int, float, str)):
+                    settings.append(value)
+                elif isinstance(value, set):
+                    settings.append(frozenset(value)) # Enum flags
+                elif prop.type in {'BOOLEAN', 'INT', 'FLOAT'}:
+                    settings.append(tuple(value))
+                else:
+                    return None
+            modifiers.append(tuple(settings))
+
+        mesh = obj.data
+        fingerprint = (mesh.name, mesh.use_auto_smooth, mesh.auto_smooth_angle, any(s < 0 for s in obj.scale), tuple(modifiers))
+        try:
+            hash(fingerprint)
+        except TypeError:
+            return None # Multi-dimensional array settings
+        return fingerprint
+
+    def get(self, obj, fingerprint):
+        if fingerprint is None:
+            return None
+        return self.entries.get(obj.data.as_pointer(), {}).get(fingerprint)
+
+    def add(self, obj, fingerprint, arrays):
+        if fingerprint is not None:
+            self.entries.setdefault(obj.data.as_pointer(), {})[fingerprint] = arrays
+        return arrays
+
+    def invalidate(self, datablock):
+        if isinstance(datablock, bpy.types.Object):
+            datablock = datablock.data
+        if datablock is not None:
+            self.entries.pop(datablock.as_pointer(), None)
+
+    def clear(self):
+        self.entries.clear()
+
+mesh_cache = War3MeshCache() # Shared by consecutive exports in the same session
+
+@persistent
+def update_mesh_cache(scene, depsgraph):
+    if mesh_cache.updating:
+        return
+    for update in depsgraph.updates:
+        if update.is_updated_geometry:
+            mesh_cache.invalidate(update.id.original)
+
+@persistent
+def clear_mesh_cache(*args):
+    mesh_cache.clear() # Datablocks are reallocated on load and undo, so their pointers can't be trusted
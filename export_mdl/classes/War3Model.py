@@ -6,10 +6,12 @@ import os.path
 
 from mathutils import Quaternion, Matrix, Vector
 
+from array import array
+
 from collections import defaultdict
 from operator import itemgetter
 
-from .War3AnimationSequence import War3AnimationSequence
+from .War3AnimationSequence import War3AnimationSequence, War3SequenceList
 from .War3AnimationCurve import War3AnimationCurve
 from .War3ParticleSystem import War3ParticleSystem
 from .War3MaterialLayer import War3MaterialLayer
@@ -23,6 +25,8 @@ from .War3Object import War3Object
 from .War3Camera import War3Camera
 from .War3CollisionShape import War3CollisionShape
 from .War3EventObject import War3EventObject
+from .War3Registry import War3Registry
+from .War3MeshCache import mesh_cache
 
 from ..utils import *
 
@@ -38,31 +42,44 @@ class War3Model:
         self.geosets = []
         self.geoset_anims = []
         self.geoset_anim_map = {}
-        self.materials = []
+        self.bone_geosets = defaultdict(list) # Bone name -> geosets that reference it, in geoset order
+        self.materials = War3Registry(key=lambda x: x.name)
         self.sequences = []
         self.global_extents_min = 0
         self.global_extents_max = 0
         self.const_color_mats = set()
         self.global_seqs = set()
         self.cameras = []
-        self.textures = []
-        self.tvertex_anims = []
+        self.textures = War3Registry()
+        self.tvertex_anims = War3Registry()
+        
+        # Per export, keyed by object pointer, so siblings don't walk the same parent chain again
+        self.parents = {}
+        self.visibilities = {}
+        self.animated = {}
+        self.fcurve_tables = {} # Action pointer -> {(data_path, index): fcurve}, indexed on the first lookup
         
         self.f2ms = 1000 / context.scene.render.fps # Frame to milisecond conversion
         self.name = bpy.path.basename(context.blend_data.filepath).replace(".blend","")
         
     @staticmethod
-    def prepare_mesh(obj, context, matrix):
-        mod = None
-        if obj.data.use_auto_smooth:
-            mod = obj.modifiers.new("EdgeSplitExport", 'EDGE_SPLIT')
-            mod.split_angle = obj.data.auto_smooth_angle
-        
-        depsgraph = context.evaluated_depsgraph_get()
-        mesh =  bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
-        
-        if obj.data.use_auto_smooth:
-            obj.modifiers.remove(mod)
+    def prepare_mesh(obj, context, matrix=None):
+        # Without a matrix, the triangulated mesh is left in local space
+        mesh_cache.updating = True
+        try:
+            mod = None
+            if obj.data.use_auto_smooth:
+                mod = obj.modifiers.new("EdgeSplitExport", 'EDGE_SPLIT')
+                mod.split_angle = obj.data.auto_smooth_angle
+            
+            depsgraph = context.evaluated_depsgraph_get()
+            mesh =  bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+            
+            if obj.data.use_auto_smooth:
+                obj.modifiers.remove(mod)
+                context.evaluated_depsgraph_get() # Settle the removal now, or the next update would clear the object's cached mesh
+        finally:
+            mesh_cache.updating = False
 
         # Triangulate for web export
         bm = bmesh.new()
@@ -71,7 +88,8 @@ class War3Model:
         if any(s < 0 for s in obj.scale):
             bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
         bmesh.ops.triangulate(bm, faces=bm.faces)
-        bmesh.ops.transform(bm, matrix=matrix, verts=bm.verts)
+        if matrix is not None:
+            bmesh.ops.transform(bm, matrix=matrix, verts=bm.verts)
         bm.to_mesh(mesh)
         bm.free()
         del bm
@@ -82,7 +100,171 @@ class War3Model:
         return mesh
        
     @staticmethod
-    def get_parent(obj):
+    def extract_mesh_arrays(mesh):
+        # Pulls everything the geoset builder needs out of a prepared mesh in a few foreach_get calls.
+        # Returns the material index and smooth flag per triangle, the mesh vertex per corner, the vertex
+        # coordinates and the flipped UV of each corner. These are what the mesh cache keeps.
+        triangles = mesh.loop_triangles
+        num_tris = len(triangles)
+        
+        tri_verts = np.empty(num_tris * 3, dtype=np.int32)
+        triangles.foreach_get('vertices', tri_verts)
+        tri_loops = np.empty(num_tris * 3, dtype=np.int32)
+        triangles.foreach_get('loops', tri_loops)
+        tri_materials = np.empty(num_tris, dtype=np.int32)
+        triangles.foreach_get('material_index', tri_materials)
+        tri_smooth = np.empty(num_tris, dtype=bool)
+        triangles.foreach_get('use_smooth', tri_smooth)
+        
+        coords = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', coords)
+        
+        uvs = np.zeros(len(mesh.loops) * 2, dtype=np.float32)
+        if len(mesh.uv_layers):
+            mesh.uv_layers.active.data.foreach_get('uv', uvs)
+        uvs = uvs.reshape(-1, 2)
+        uvs[:, 1] = 1 - uvs[:, 1] # For some reason, uv Y coordinates appear flipped. This should fix that. 
+        
+        return tri_materials, tri_verts, tri_smooth, coords.reshape(-1, 3), uvs[tri_loops]
+        
+    @staticmethod
+    def place_mesh_arrays(mesh_arrays, matrix):
+        # Moves local-space mesh arrays by the object's matrix. Normals are derived from the placed triangles
+        # the same way Blender does it (vertex normals are face normals weighted by corner angle), so for the rotated
+        # and uniformly scaled objects the cache takes, the result matches transforming the mesh first. Returns the material index per triangle, the mesh
+        # vertex per corner, and a (corners, 8) array holding the rounded coordinate, normal and UV of each corner.
+        tri_materials, tri_verts, tri_smooth, coords, corner_uvs = mesh_arrays
+        
+        def normalize(vectors):
+            lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+            return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
+            
+        m = np.array(matrix, dtype=np.float64)
+        coords = (coords @ m[:3, :3].T + m[:3, 3]).astype(np.float32).astype(np.float64) # Stored as floats, like mesh data
+        
+        points = coords[tri_verts].reshape(-1, 3, 3)
+        tri_normals = normalize(np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 1]))
+        
+        to_prev = normalize(np.roll(points, 1, axis=1) - points)
+        to_next = normalize(np.roll(points, -1, axis=1) - points)
+        angles = np.arccos(np.clip(np.sum(to_prev * to_next, axis=2), -1, 1))
+        normals = np.zeros_like(coords)
+        np.add.at(normals, tri_verts, (tri_normals[:, None, :] * angles[:, :, None]).reshape(-1, 3))
+        lengths = np.linalg.norm(normals, axis=1)
+        normals[lengths == 0] = coords[lengths == 0] # Blender's fallback for vertices without a usable face
+        normals = normalize(normals).astype(np.float32)
+        tri_normals = tri_normals.astype(np.float32)
+        
+        return tri_materials, tri_verts, War3Model.corner_array(tri_verts, tri_smooth, coords, normals, tri_normals, corner_uvs)
+        
+    @staticmethod
+    def read_mesh_arrays(mesh):
+        # Same as place_mesh_arrays for a mesh that was prepared with its matrix, taking Blender's own normals
+        tri_materials, tri_verts, tri_smooth, coords, corner_uvs = War3Model.extract_mesh_arrays(mesh)
+        
+        tri_normals = np.empty(len(tri_materials) * 3, dtype=np.float32)
+        mesh.loop_triangles.foreach_get('normal', tri_normals)
+        normals = np.empty(coords.size, dtype=np.float32)
+        mesh.vertices.foreach_get('normal', normals)
+        
+        return tri_materials, tri_verts, War3Model.corner_array(tri_verts, tri_smooth, coords, normals.reshape(-1, 3), tri_normals.reshape(-1, 3), corner_uvs)
+        
+    @staticmethod
+    def corner_array(tri_verts, tri_smooth, coords, normals, tri_normals, corner_uvs):
+        # A (corners, 8) array holding the rounded coordinate, normal and UV of each corner. Smooth triangles
+        # take the vertex normal, flat ones their face normal.
+        corner_normals = np.where(np.repeat(tri_smooth, 3)[:, None], normals[tri_verts], np.repeat(tri_normals, 3, axis=0))
+        corners = np.hstack((coords[tri_verts], corner_normals, corner_uvs)).astype(np.float64)
+        
+        return np.round(corners, decimal_places)
+        
+    @staticmethod
+    def create_mesh(geoset, global_matrix, convert_to_quads=False):
+        # Builds a mesh straight from the geoset's flat columns. Topology, UVs, smoothing and normals
+        # all go through foreach_set, so no per-face tuples are created and no mode switches are needed.
+        mesh = bpy.data.meshes.new("Mesh")
+        
+        vertex_count = len(geoset.positions) // 3
+        loop_count = len(geoset.triangles)
+        tri_count = loop_count // 3
+        
+        if np is not None:
+            loop_starts = np.arange(0, loop_count, 3, dtype=np.int32)
+            loop_totals = np.full(tri_count, 3, dtype=np.int32)
+        else:
+            loop_starts = array('i', range(0, loop_count, 3))
+            loop_totals = array('i', [3]) * tri_count
+        
+        mesh.vertices.add(vertex_count)
+        mesh.vertices.foreach_set('co', geoset.positions)
+        mesh.loops.add(loop_count)
+        mesh.loops.foreach_set('vertex_index', geoset.triangles)
+        mesh.polygons.add(tri_count)
+        mesh.polygons.foreach_set('loop_start', loop_starts)
+        mesh.polygons.foreach_set('loop_total', loop_totals)
+        mesh.update(calc_edges=True)
+        
+        if convert_to_quads:
+            # Same thresholds as the tris_convert_to_quads operator
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            bmesh.ops.join_triangles(bm, faces=bm.faces, angle_face_threshold=math.radians(40), angle_shape_threshold=math.radians(40))
+            bm.to_mesh(mesh)
+            bm.free()
+            
+        mesh.transform(global_matrix)
+        
+        # Mesh will already have split nornals, rest should be smooth
+        mesh.polygons.foreach_set('use_smooth', [True] * len(mesh.polygons))
+        
+        # UVs
+        uvs = mesh.uv_layers.new(name='UV')
+        if len(geoset.uvs):
+            loop_vertices = array('i', [0]) * len(mesh.loops)
+            mesh.loops.foreach_get('vertex_index', loop_vertices)
+            if np is not None:
+                loop_uvs = np.asarray(geoset.uvs, dtype=np.float32).reshape(-1, 2)[np.frombuffer(loop_vertices, dtype=np.int32)]
+                loop_uvs[:, 1] = 1 - loop_uvs[:, 1] # UV Y is flipped in MDL source
+                loop_uvs = loop_uvs.ravel()
+            else:
+                loop_uvs = array('f')
+                for vertex_index in loop_vertices:
+                    loop_uvs.append(geoset.uvs[vertex_index * 2])
+                    loop_uvs.append(1 - geoset.uvs[vertex_index * 2 + 1])
+            uvs.data.foreach_set('uv', loop_uvs)
+            
+        # Normals
+        if len(geoset.normals) == vertex_count * 3:
+            if np is not None:
+                normals = np.asarray(geoset.normals, dtype=np.float32).reshape(-1, 3)
+            else:
+                normals = list(zip(*[iter(geoset.normals)] * 3))
+            mesh.normals_split_custom_set_from_vertices(normals)
+            
+        return mesh
+        
+    @staticmethod
+    def assign_vertex_weights(geoset, bone_groups, vertex_count):
+        # Every bone in a vertex's matrix gets an equal share of it. The vertices of each (bone, weight)
+        # pair are collected first, so each pair is a single add() call instead of one per vertex.
+        weight_buckets = defaultdict(list)
+        groups = geoset.groups if len(geoset.groups) else [0] * vertex_count
+        for vertex_index, group in enumerate(groups):
+            matrix = geoset.matrices[group]
+            weight = 1.0 / len(matrix)
+            for bone_id in matrix:
+                weight_buckets[(bone_id, weight)].append(vertex_index)
+                
+        for (bone_id, weight), vertex_indices in weight_buckets.items():
+            bone_groups[bone_id].add(vertex_indices, weight, 'ADD')
+        
+    def get_parent(self, obj):
+        key = obj.as_pointer()
+        if key not in self.parents:
+            self.parents[key] = self.resolve_parent(obj)
+        return self.parents[key]
+        
+    def resolve_parent(self, obj):
         parent = obj.parent
        
         if parent is None:
@@ -94,21 +276,48 @@ class War3Model:
         if parent.type == 'EMPTY' and (parent.name.startswith("Bone_") or parent.name.startswith("bone_") or parent.name.startswith("helper_")):
             return parent.name
             
-        anim_loc = get_curves(parent, 'location', (1, 2, 3))
-        anim_rot = get_curves(parent, 'rotation_quaternion', (1, 2, 3, 4))
-        anim_scale = get_curves(parent, 'scale', (1, 2, 3))
-        animations = (anim_loc, anim_rot, anim_scale)
-        
-        if not any(animations):
-            root_parent = War3Model.get_parent(parent)
+        if not self.is_animated(parent):
+            root_parent = self.get_parent(parent)
             if root_parent is not None:
                 return root_parent
                 
         return parent.name
         
+    def find_fcurve(self, action, data_path, index=0):
+        # Replaces action.fcurves.find: each action's curves are indexed in one pass per export, then every lookup is a dict hit
+        key = action.as_pointer()
+        table = self.fcurve_tables.get(key)
+        if table is None:
+            table = {}
+            for fcurve in action.fcurves:
+                table.setdefault((fcurve.data_path, fcurve.array_index), fcurve) # The first of duplicate curves wins, as with find
+            self.fcurve_tables[key] = table
+        return table.get((data_path, index))
+        
+    def get_curve(self, anim_data, data_path, num_indices, scale=1):
+        return War3AnimationCurve.get(anim_data, data_path, num_indices, self.sequences, scale, self.find_fcurve)
+        
+    def is_animated(self, obj):
+        key = obj.as_pointer()
+        animated = self.animated.get(key)
+        if animated is None:
+            animated = False
+            if obj.animation_data and obj.animation_data.action:
+                action = obj.animation_data.action
+                channels = (('location', (1, 2, 3)), ('rotation_quaternion', (1, 2, 3, 4)), ('scale', (1, 2, 3)))
+                animated = any(self.find_fcurve(action, data_path, index) is not None for data_path, indices in channels for index in indices)
+            self.animated[key] = animated
+        return animated
+        
     def get_visibility(self, obj):
+        key = obj.as_pointer()
+        if key not in self.visibilities:
+            self.visibilities[key] = self.resolve_visibility(obj)
+        return self.visibilities[key]
+        
+    def resolve_visibility(self, obj):
         if obj.animation_data is not None:
-            curve = War3AnimationCurve.get(obj.animation_data, 'hide_render', 1, self.sequences)
+            curve = self.get_curve(obj.animation_data, 'hide_render', 1)
             if curve is not None:
                 return curve
         if obj.parent is not None and obj.parent_type != 'BONE':
@@ -119,6 +328,10 @@ class War3Model:
         
         scene = context.scene
         
+        self.fcurve_tables.clear() # Actions may have been edited since a previous export of this model
+        self.parents.clear()
+        self.visibilities.clear()
+        self.animated.clear()
         self.sequences = self.get_sequences(scene)
         
         objs = []
@@ -131,7 +344,7 @@ class War3Model:
             objs = (obj for obj in scene.objects if obj.visible_get())
             
         for obj in objs:
-            parent = War3Model.get_parent(obj)
+            parent = self.get_parent(obj)
             
             billboarded = False
             billboard_lock = (False, False, False)
@@ -143,21 +356,21 @@ class War3Model:
             # Animations
             visibility = self.get_visibility(obj)
                 
-            anim_loc = War3AnimationCurve.get(obj.animation_data, 'location', 3, self.sequences)
+            anim_loc = self.get_curve(obj.animation_data, 'location', 3)
             if anim_loc is not None and settings.optimize_animation:
-                anim_loc.optimize(settings.optimize_tolerance, self.sequences)
+                anim_loc.optimize(settings.optimize_tolerance, self.sequences, settings.optimize_bezier)
                 
-            anim_rot = War3AnimationCurve.get(obj.animation_data, 'rotation_quaternion', 4, self.sequences)
+            anim_rot = self.get_curve(obj.animation_data, 'rotation_quaternion', 4)
             
             if anim_rot is None:
-                anim_rot = War3AnimationCurve.get(obj.animation_data, 'rotation_euler', 3, self.sequences)
+                anim_rot = self.get_curve(obj.animation_data, 'rotation_euler', 3)
                 
             if anim_rot is not None and settings.optimize_animation:
-                anim_rot.optimize(settings.optimize_tolerance, self.sequences)
+                anim_rot.optimize(settings.optimize_tolerance, self.sequences, settings.optimize_bezier)
                 
-            anim_scale = War3AnimationCurve.get(obj.animation_data, 'scale', 3, self.sequences)
+            anim_scale = self.get_curve(obj.animation_data, 'scale', 3)
             if anim_scale is not None and settings.optimize_animation:
-                anim_scale.optimize(settings.optimize_tolerance, self.sequences)
+                anim_scale.optimize(settings.optimize_tolerance, self.sequences, settings.optimize_bezier)
                 
             is_animated = any((anim_loc, anim_rot, anim_scale))
             
@@ -243,10 +456,22 @@ class War3Model:
                     self.objects['collisionshape'].add(collider)
                     
             elif obj.type == 'MESH' or obj.type == 'CURVE':
-                mesh = self.prepare_mesh(obj, context, settings.global_matrix @ obj.matrix_world)
+                mesh_matrix = settings.global_matrix @ obj.matrix_world
+                mesh = None
+                mesh_arrays = None
+                fingerprint = mesh_cache.fingerprint(obj) if np is not None else None
+                if fingerprint is not None:
+                    # Objects sharing a mesh and modifier stack reuse its local-space arrays, only the matrix differs.
+                    # Armature-deformed meshes are never cached, so get_bone_groups always has the mesh to read.
+                    mesh_arrays = mesh_cache.get(obj, fingerprint)
+                    if mesh_arrays is None:
+                        mesh = self.prepare_mesh(obj, context)
+                        mesh_arrays = mesh_cache.add(obj, fingerprint, self.extract_mesh_arrays(mesh))
+                else:
+                    mesh = self.prepare_mesh(obj, context, mesh_matrix)
                 
                 # Geoset Animation
-                vertexcolor_anim = War3AnimationCurve.get(obj.animation_data, 'color', 3, self.sequences)
+                vertexcolor_anim = self.get_curve(obj.animation_data, 'color', 3)
                 vertexcolor = None
                 
                 if any(i < 0.999 for i in obj.color[:3]):
@@ -260,7 +485,7 @@ class War3Model:
                             attr = "outputs" if node.bl_idname == 'ShaderNodeRGB' else "inputs"
                             vertexcolor = tuple(getattr(node, attr)[0].default_value[:3])
                             if hasattr(mat.node_tree, "animation_data"):
-                                vertexcolor_anim = War3AnimationCurve.get(mat.node_tree.animation_data, 'nodes["VertexColor"].%s[0].default_value' % attr, 3, self.sequences)
+                                vertexcolor_anim = self.get_curve(mat.node_tree.animation_data, 'nodes["VertexColor"].%s[0].default_value' % attr, 3)
                 geoset_anim = None
                 geoset_anim_hash = 0
                 if any((vertexcolor, vertexcolor_anim, visibility)):
@@ -292,13 +517,11 @@ class War3Model:
                     
                     if bone.anim_loc is not None:
                         self.register_global_sequence(bone.anim_loc)
-                        bone.anim_loc.transform_vec(obj.matrix_world.inverted())
-                        bone.anim_loc.transform_vec(settings.global_matrix)
+                        bone.anim_loc.transform_vec(obj.matrix_world.inverted(), settings.global_matrix)
                         
                     if bone.anim_rot is not None:
                         self.register_global_sequence(bone.anim_rot)
-                        bone.anim_rot.transform_rot(obj.matrix_world.inverted())
-                        bone.anim_rot.transform_rot(settings.global_matrix)
+                        bone.anim_rot.transform_rot(obj.matrix_world.inverted(), settings.global_matrix)
                         
                     self.register_global_sequence(bone.anim_scale)
                     bone.billboarded = billboarded
@@ -309,11 +532,14 @@ class War3Model:
                     parent = bone.name
                     
                     
-                for tri in mesh.loop_triangles:
+                group_names = [vg.name for vg in obj.vertex_groups]
+                vertex_bone_groups = {}
+                
+                def get_geoset(material_index):
                     # Textures and materials
                     mat_name = "default"
                     if obj.material_slots and len(obj.material_slots):
-                        mat = obj.material_slots[tri.material_index].material
+                        mat = obj.material_slots[material_index].material
                         if mat is not None:
                             mat_name = mat.name
                             mats.add(mat)
@@ -328,59 +554,104 @@ class War3Model:
                             geoset.geoset_anim = geoset_anim
                             geoset_anim.geoset = geoset
                         geoset_map[(mat_name, geoset_anim_hash)] = geoset
+                    return geoset
+                    
+                def get_bone_groups(vert):
+                    if vert in vertex_bone_groups:
+                        return vertex_bone_groups[vert]
                         
-                    # Vertices, faces, and matrices  
-                    vertexmap = {}
-                    for vert, loop in zip(tri.vertices, tri.loops):
-                        co = mesh.vertices[vert].co
-                        coord = (rnd(co.x), rnd(co.y), rnd(co.z))
-                        n = mesh.vertices[vert].normal if tri.use_smooth else tri.normal
-                        norm = (rnd(n.x), rnd(n.y), rnd(n.z))
-                        uv = mesh.uv_layers.active.data[loop].uv if len(mesh.uv_layers) else Vector((0.0, 0.0))
-                        uv[1] = 1 - uv[1] # For some reason, uv Y coordinates appear flipped. This should fix that. 
-                        tvert = (rnd(uv.x), rnd(uv.y))
-                        groups = None
-                        matrix = 0
+                    groups = None
+                    if armature is not None:
+                        vgroups = sorted(mesh.vertices[vert].groups[:], key=lambda x:x.weight, reverse=True) # Sort bones by descending weight
+                        if len(vgroups):
+                            # Warcraft does not support vertex weights, so we exclude groups with too small influence
+                            groups = list(group_names[vg.group] for vg in vgroups if (group_names[vg.group] in bone_names and vg.weight > 0.25))[:3]
+                            if not len(groups):
+                                for vg in vgroups:
+                                    # If we didn't find a group, just take the best match (the list is already sorted by weight)
+                                    if group_names[vg.group] in bone_names:
+                                        groups = [group_names[vg.group]]
+                                        break
                         
-                        if armature is not None:
-                            vgroups = sorted(mesh.vertices[vert].groups[:], key=lambda x:x.weight, reverse=True) # Sort bones by descending weight
-                            if len(vgroups):
-                                # Warcraft does not support vertex weights, so we exclude groups with too small influence
-                                groups = list(obj.vertex_groups[vg.group].name for vg in vgroups if (obj.vertex_groups[vg.group].name in bone_names and vg.weight > 0.25))[:3]
-                                if not len(groups):
-                                    for vg in vgroups:
-                                        # If we didn't find a group, just take the best match (the list is already sorted by weight)
-                                        if obj.vertex_groups[vg.group].name in bone_names:
-                                            groups = [obj.vertex_groups[vg.group].name]
-                                            break
-                            
-                        if parent is not None and (groups is None or len(groups) == 0):
-                            groups = [parent]
-                                    
-                        if groups is not None:
-                            if groups not in geoset.matrices:
-                                geoset.matrices.append(groups)
-                            matrix = geoset.matrices.index(groups)
-
+                    if parent is not None and (groups is None or len(groups) == 0):
+                        groups = [parent]
+                        
+                    if groups is not None:
+                        groups = tuple(groups)
+                    vertex_bone_groups[vert] = groups # Shared vertices are resolved once, not once per loop
+                    return groups
+                    
+                if np is not None:
+                    if mesh_arrays is not None:
+                        tri_materials, corner_verts, corners = self.place_mesh_arrays(mesh_arrays, mesh_matrix)
+                    else:
+                        tri_materials, corner_verts, corners = self.read_mesh_arrays(mesh)
+                    
+                    # Geosets are created in the order their materials first show up, same as the per-triangle path
+                    material_indices, first_tris = np.unique(tri_materials, return_index=True)
+                    chunks = {}
+                    for material_index in material_indices[np.argsort(first_tris)]:
+                        chunks.setdefault(get_geoset(int(material_index)), []).append(material_index)
+                        
+                    for geoset, chunk_materials in chunks.items():
+                        tri_mask = np.isin(tri_materials, chunk_materials)
+                        chunk_verts = corner_verts.reshape(-1, 3)[tri_mask].ravel()
+                        chunk_corners = corners.reshape(-1, 3, 8)[tri_mask].reshape(-1, 8)
                         
-                        vertex = (coord, norm, tvert, matrix)
-                        if vertex not in geoset.vertices:
-                            geoset.vertices.append(vertex)
+                        # Matrix groups are registered in the order their vertices are first used
+                        verts, first_corners, vert_inverse = np.unique(chunk_verts, return_index=True, return_inverse=True)
+                        vert_matrices = np.zeros(len(verts))
+                        for i in np.argsort(first_corners):
+                            groups = get_bone_groups(int(verts[i]))
+                            if groups is not None:
+                                vert_matrices[i] = geoset.add_matrix(groups)
+                                
+                        # Weld identical corners in bulk, then register the survivors in order of first use
+                        records = np.column_stack((chunk_corners, vert_matrices[vert_inverse.ravel()]))
+                        unique_records, first_records, record_inverse = np.unique(records, axis=0, return_index=True, return_inverse=True)
+                        record_ids = np.empty(len(unique_records), dtype=np.int64)
+                        for i in np.argsort(first_records):
+                            r = unique_records[i].tolist()
+                            record_ids[i] = geoset.add_vertex(((r[0], r[1], r[2]), (r[3], r[4], r[5]), (r[6], r[7]), int(r[8])))
                             
-                        vertexmap[vert] = geoset.vertices.index(vertex)
+                        geoset.triangles.extend(map(tuple, record_ids[record_inverse.ravel()].reshape(-1, 3).tolist()))
+                        mesh_geosets.add(geoset)
+                else:
+                    for tri in mesh.loop_triangles:
+                        geoset = get_geoset(tri.material_index)
                             
-                    # Triangles, normals, vertices, and UVs
-                    geoset.triangles.append((vertexmap[tri.vertices[0]], vertexmap[tri.vertices[1]], vertexmap[tri.vertices[2]]))
-                    
-                    mesh_geosets.add(geoset)
+                        # Vertices, faces, and matrices  
+                        vertexmap = {}
+                        for vert, loop in zip(tri.vertices, tri.loops):
+                            co = mesh.vertices[vert].co
+                            coord = (rnd(co.x), rnd(co.y), rnd(co.z))
+                            n = mesh.vertices[vert].normal if tri.use_smooth else tri.normal
+                            norm = (rnd(n.x), rnd(n.y), rnd(n.z))
+                            uv = mesh.uv_layers.active.data[loop].uv if len(mesh.uv_layers) else Vector((0.0, 0.0))
+                            uv[1] = 1 - uv[1] # For some reason, uv Y coordinates appear flipped. This should fix that. 
+                            tvert = (rnd(uv.x), rnd(uv.y))
+                            matrix = 0
+                            
+                            groups = get_bone_groups(vert)
+                            if groups is not None:
+                                matrix = geoset.add_matrix(groups)
+                            
+                            vertex = (coord, norm, tvert, matrix)
+                            vertexmap[vert] = geoset.add_vertex(vertex)
+                                
+                        # Triangles, normals, vertices, and UVs
+                        geoset.triangles.append((vertexmap[tri.vertices[0]], vertexmap[tri.vertices[1]], vertexmap[tri.vertices[2]]))
+                        
+                        mesh_geosets.add(geoset)
                     
                 for geoset in mesh_geosets:
                     geoset.objects.append(obj)
                     if not len(geoset.matrices) and parent is not None:
-                        geoset.matrices.append([parent])
+                        geoset.add_matrix((parent,))
                             
                 # obj.to_mesh_clear()
-                bpy.data.meshes.remove(mesh)
+                if mesh is not None:
+                    bpy.data.meshes.remove(mesh)
                 
                 
             elif obj.type == 'EMPTY':
@@ -389,7 +660,7 @@ class War3Model:
                     eventobj.pivot = settings.global_matrix @ Vector(obj.location)
                     
                     for datapath in ('["event_track"]', '["eventtrack"]', '["EventTrack"]'):
-                        eventobj.track = War3AnimationCurve.get(obj.animation_data, datapath, 1, self.sequences) # get_curve(obj, ['["eventtrack"]', '["EventTrack"]', '["event_track"]'])  
+                        eventobj.track = self.get_curve(obj.animation_data, datapath, 1) # get_curve(obj, ['["eventtrack"]', '["EventTrack"]', '["event_track"]'])  
                         if eventobj.track is not None:
                             self.register_global_sequence(eventobj.track)
                             break
@@ -419,15 +690,13 @@ class War3Model:
                     
                     if bone.anim_loc is not None:
                         self.register_global_sequence(bone.anim_loc)
-                        bone.anim_loc.transform_vec(obj.matrix_world.inverted())
+                        bone.anim_loc.transform_vec(obj.matrix_world.inverted(), settings.global_matrix)
                         # if obj.parent is not None:
                         #     bone.anim_loc.transform_vec(obj.parent.matrix_world.inverted())
-                        bone.anim_loc.transform_vec(settings.global_matrix)
                         
                     if bone.anim_rot is not None:
                         self.register_global_sequence(bone.anim_rot)
-                        bone.anim_rot.transform_rot(obj.matrix_world.inverted())
-                        bone.anim_rot.transform_rot(settings.global_matrix)
+                        bone.anim_rot.transform_rot(obj.matrix_world.inverted(), settings.global_matrix)
                         
                     bone.billboarded = billboarded
                     bone.billboard_lock = billboard_lock
@@ -448,14 +717,16 @@ class War3Model:
                 if root.anim_loc is not None:
                     self.register_global_sequence(root.anim_loc)
                     if obj.parent is not None:
-                        root.anim_loc.transform_vec(obj.parent.matrix_world.inverted())
-                    root.anim_loc.transform_vec(settings.global_matrix)
+                        root.anim_loc.transform_vec(obj.parent.matrix_world.inverted(), settings.global_matrix)
+                    else:
+                        root.anim_loc.transform_vec(settings.global_matrix)
                     
                 if root.anim_rot is not None:
                     self.register_global_sequence(root.anim_rot)
                     if obj.parent is not None:
-                        root.anim_rot.transform_rot(obj.parent.matrix_world.inverted())
-                    root.anim_rot.transform_rot(settings.global_matrix)
+                        root.anim_rot.transform_rot(obj.parent.matrix_world.inverted(), settings.global_matrix)
+                    else:
+                        root.anim_rot.transform_rot(settings.global_matrix)
                 
                 root.visibility = visibility
                 self.register_global_sequence(visibility)
@@ -473,20 +744,20 @@ class War3Model:
                     bone.pivot = obj.matrix_world @ Vector(b.bone.head_local) # Armature space to world space
                     bone.pivot = settings.global_matrix @ Vector(bone.pivot) # Axis conversion
                     datapath = 'pose.bones[\"'+b.name+'\"].%s'
-                    bone.anim_loc = War3AnimationCurve.get(obj.animation_data, datapath % 'location', 3, self.sequences) # get_curves(obj, datapath % 'location', (0, 1, 2))
+                    bone.anim_loc = self.get_curve(obj.animation_data, datapath % 'location', 3) # get_curves(obj, datapath % 'location', (0, 1, 2))
 
                     if settings.optimize_animation and bone.anim_loc is not None:
-                        bone.anim_loc.optimize(settings.optimize_tolerance, self.sequences)
+                        bone.anim_loc.optimize(settings.optimize_tolerance, self.sequences, settings.optimize_bezier)
 
-                    bone.anim_rot = War3AnimationCurve.get(obj.animation_data, datapath % 'rotation_quaternion', 4, self.sequences) # get_curves(obj, datapath % 'rotation_quaternion', (0, 1, 2, 3))
+                    bone.anim_rot = self.get_curve(obj.animation_data, datapath % 'rotation_quaternion', 4) # get_curves(obj, datapath % 'rotation_quaternion', (0, 1, 2, 3))
                     if bone.anim_rot is None:
-                        bone.anim_rot = War3AnimationCurve.get(obj.animation_data, datapath % 'rotation_euler', 3, self.sequences)
+                        bone.anim_rot = self.get_curve(obj.animation_data, datapath % 'rotation_euler', 3)
                     if settings.optimize_animation and bone.anim_rot is not None:
-                        bone.anim_rot.optimize(settings.optimize_tolerance, self.sequences)
+                        bone.anim_rot.optimize(settings.optimize_tolerance, self.sequences, settings.optimize_bezier)
 
-                    bone.anim_scale = War3AnimationCurve.get(obj.animation_data, datapath % 'scale', 3, self.sequences) # get_curves(obj, datapath % 'scale', (0, 1, 2))
+                    bone.anim_scale = self.get_curve(obj.animation_data, datapath % 'scale', 3) # get_curves(obj, datapath % 'scale', (0, 1, 2))
                     if settings.optimize_animation and bone.anim_scale is not None:
-                        bone.anim_scale.optimize(settings.optimize_tolerance, self.sequences)
+                        bone.anim_scale.optimize(settings.optimize_tolerance, self.sequences, settings.optimize_bezier)
                     
                     self.register_global_sequence(bone.anim_scale)
                     
@@ -498,8 +769,7 @@ class War3Model:
                     if bone.anim_rot is not None:
                         mat_pose_ws = obj.matrix_world @ b.bone.matrix_local
                         mat_rest_ws = obj.matrix_world @ b.matrix
-                        bone.anim_rot.transform_rot(mat_pose_ws)
-                        bone.anim_rot.transform_rot(settings.global_matrix)
+                        bone.anim_rot.transform_rot(mat_pose_ws, settings.global_matrix)
                         self.register_global_sequence(bone.anim_rot)
                     
                     self.objects['bone'].add(bone)
@@ -516,27 +786,27 @@ class War3Model:
                     light.type = light_data.light_type
                 
                     light.intensity = light_data.intensity
-                    light.intensity_anim = War3AnimationCurve.get(obj.data.animation_data, 'mdl_light.intensity', 1, self.sequences) #get_curve(obj.data, ['mdl_light.intensity'])
+                    light.intensity_anim = self.get_curve(obj.data.animation_data, 'mdl_light.intensity', 1) #get_curve(obj.data, ['mdl_light.intensity'])
                     self.register_global_sequence(light.intensity_anim)
                     
                     light.atten_start = light_data.atten_start
-                    light.atten_start_anim = War3AnimationCurve.get(obj.data.animation_data, 'mdl_light.atten_start', 1, self.sequences) # get_curve(obj.data, ['mdl_light.atten_start'])
+                    light.atten_start_anim = self.get_curve(obj.data.animation_data, 'mdl_light.atten_start', 1) # get_curve(obj.data, ['mdl_light.atten_start'])
                     self.register_global_sequence(light.atten_start_anim)
                         
                     light.atten_end = light_data.atten_end
-                    light.atten_end_anim = War3AnimationCurve.get(obj.data.animation_data, 'mdl_light.atten_end', 1, self.sequences) # get_curve(obj.data, ['mdl_light.atten_end'])
+                    light.atten_end_anim = self.get_curve(obj.data.animation_data, 'mdl_light.atten_end', 1) # get_curve(obj.data, ['mdl_light.atten_end'])
                     self.register_global_sequence(light.atten_end_anim)
                     
                     light.color = light_data.color
-                    light.color_anim = War3AnimationCurve.get(obj.data.animation_data, 'mdl_light.color', 3, self.sequences) # get_curve(obj.data, ['mdl_light.color'])
+                    light.color_anim = self.get_curve(obj.data.animation_data, 'mdl_light.color', 3) # get_curve(obj.data, ['mdl_light.color'])
                     self.register_global_sequence(light.color_anim)
                         
                     light.amb_color = light_data.amb_color
-                    light.amb_color_anim = War3AnimationCurve.get(obj.data.animation_data, 'mdl_light.amb_color', 3, self.sequences) # get_curve(obj.data, ['mdl_light.amb_color'])
+                    light.amb_color_anim = self.get_curve(obj.data.animation_data, 'mdl_light.amb_color', 3) # get_curve(obj.data, ['mdl_light.amb_color'])
                     self.register_global_sequence(light.amb_color_anim)
                         
                     light.amb_intensity = light_data.amb_intensity
-                    light.amb_intensity_anim = War3AnimationCurve.get(obj.data.animation_data, 'mdl_light.amb_intensity', 1, self.sequences) # get_curve(obj.data, ['obj.mdl_light.amb_intensity'])
+                    light.amb_intensity_anim = self.get_curve(obj.data.animation_data, 'mdl_light.amb_intensity', 1) # get_curve(obj.data, ['obj.mdl_light.amb_intensity'])
                     self.register_global_sequence(light.amb_intensity_anim)
                         
                 light.visibility = visibility
@@ -557,30 +827,37 @@ class War3Model:
           
             
         self.geosets = list(geoset_map.values())
-        self.materials = [War3Material.get(mat, self) for mat in mats]
+        for geoset in self.geosets:
+            for bone in geoset.bones:
+                self.bone_geosets[bone].append(geoset)
+        materials = [War3Material.get(mat, self) for mat in mats]
         # Add default material if no other materials present
         if any((x for x in self.geosets if x.mat_name == "default")):
             default_mat = War3Material("default")
             default_mat.layers.append(War3MaterialLayer())
-            self.materials.append(default_mat)
+            materials.append(default_mat)
 
             if len(self.textures) == 0:
                 default_texture = War3Texture("Textures/white.blp")
-                self.textures.append(default_texture)
+                self.textures.add(default_texture)
             
-        self.materials = sorted(self.materials, key=lambda x: x.priority_plane)
+        self.materials = War3Registry(sorted(materials, key=lambda x: x.priority_plane), key=lambda x: x.name)
 
         layers = list(itertools.chain.from_iterable([material.layers for material in self.materials]))
         
         # Demote bones to helpers if they have no attached geosets
         for bone in self.objects['bone']:
-            if not any([g for g in self.geosets if bone.name in itertools.chain.from_iterable(g.matrices)]):
+            if bone.name not in self.bone_geosets:
                 self.objects['helper'].add(bone)
                 
         self.objects['bone'] -= self.objects['helper']
              
-        self.tvertex_anims = list(set((layer.texture_anim for layer in layers if layer.texture_anim is not None)))
-        
+        self.tvertex_anims = War3Registry(layer.texture_anim for layer in layers if layer.texture_anim is not None)
+        for layer in layers:
+            if layer.texture_anim is not None:
+                # Equal anims share the registered instance, so the track pass changes every layer's copy alike
+                layer.texture_anim = self.tvertex_anims[self.tvertex_anims.id(layer.texture_anim)]
+
         vertices_all = []
         
         self.objects_all = []
@@ -617,10 +894,12 @@ class War3Model:
         self.geoset_anims = list(set(g.geoset_anim for g in self.geosets if g.geoset_anim is not None))
         
         self.global_extents_min, self.global_extents_max = calc_extents(vertices_all) if len(vertices_all) else ((0, 0, 0), (0, 0, 0))
+        self.eliminate_redundant_tracks()
         self.global_seqs = sorted(self.global_seqs) 
+        self.freeze()
            
         
-    def to_scene(self, context, global_matrix, folder):
+    def to_scene(self, context, global_matrix, folder, convert_to_quads=True):
         
         objects = {}
         materials = {}
@@ -932,8 +1211,7 @@ class War3Model:
                 matrix = matrix.to_3x3().to_4x4() @ global_matrix
                 node.anim_loc.to_fcurves(pose_bone, armature_obj, 'location', 'pose.bones["%s"].location' % node.name, matrix)
             if node.anim_rot is not None:
-                node.anim_rot.transform_rot(global_matrix)
-                node.anim_rot.transform_rot(matrix)
+                node.anim_rot.transform_rot(global_matrix, matrix)
                 node.anim_rot.to_fcurves(pose_bone, armature_obj, 'rotation_quaternion', 'pose.bones["%s"].rotation_quaternion' % node.name)
             if node.anim_scale is not None:
                 node.anim_scale.to_fcurves(pose_bone, armature_obj, 'scale', 'pose.bones["%s"].scale' % node.name)
@@ -963,31 +1241,12 @@ class War3Model:
 
         # Geosets
         for geoset_id, geoset in enumerate(self.geosets):
-            mesh = bpy.data.meshes.new("Mesh")
+            mesh = War3Model.create_mesh(geoset, global_matrix, convert_to_quads)
             material = materials[geoset.material_id]
-                    
-            verts = [vertex[0] for vertex in geoset.vertices]
-            faces = [tuple(geoset.triangles[i:i + 3]) for i in range(0, len(geoset.triangles), 3)] # Group triangles into tuples of 3
-            normals = [Vector(vertex[1]) for vertex in geoset.vertices]
-            mesh.from_pydata(verts, [], faces)
-            mesh.transform(global_matrix)
+            vertex_count = len(mesh.vertices)
 
             is_skinned = len(geoset.matrices) > 1
 
-            # Mesh will already have split nornals, rest should be smooth
-            for f in mesh.polygons:
-                f.use_smooth = True
-
-            # UVs
-            uvs = mesh.uv_layers.new(name='UV')
-            for face in mesh.polygons:
-                for loop_index in range(face.loop_start, face.loop_start + face.loop_total):
-                    loop = mesh.loops[loop_index]
-                    uv = geoset.vertices[loop.vertex_index][2]
-                    uvs.data[loop_index].uv = (uv[0], 1 - uv[1]) # UV Y is flipped in MDL source
-
-            # Normals
-            mesh.normals_split_custom_set_from_vertices(normals)
             mesh_obj = None
 
             if is_skinned:
@@ -1003,11 +1262,7 @@ class War3Model:
                     if bone.object_id in skinned_bone_ids:
                         bone_groups[bone_id] = mesh_obj.vertex_groups.new(name=bone.name)
 
-                for vertex_index, vertex in enumerate(geoset.vertices):
-                    matrix = geoset.matrices[vertex[3]]
-                    weight = 1.0 / len(matrix)
-                    for bone_id in matrix:
-                        bone_groups[bone_id].add([vertex_index], weight, 'ADD')
+                War3Model.assign_vertex_weights(geoset, bone_groups, vertex_count)
 
                 armature_mod = mesh_obj.modifiers.new(name='Armature', type='ARMATURE')
                 armature_mod.object = armature_obj
@@ -1062,11 +1317,6 @@ class War3Model:
 
             # Add material slot to mesh
             mesh_obj.data.materials.append(material)
-            # Convert triangles to quads for convenience
-            context.view_layer.objects.active = mesh_obj
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.mesh.tris_convert_to_quads()
-            bpy.ops.object.mode_set(mode='OBJECT')
 
         # Nodes
         for node_type in self.objects:
@@ -1255,9 +1505,59 @@ class War3Model:
         if len(sequences) == 0:
             sequences.append(War3AnimationSequence("Stand", 0, 3333))
             
-        sequences.sort(key=lambda x:x.start)
+        return War3SequenceList(sequences, self.f2ms) # Sorted, with an interval index shared by every curve
+        
+    def freeze(self):
+        # Called once the model is complete. The collections the writers reference by index become tuples
+        # or registries, with a lookup table for each, so resolving an id no longer scans a list.
+        self.geosets = tuple(self.geosets)
+        self.geoset_anims = tuple(self.geoset_anims)
+        self.tvertex_anims = War3Registry(self.tvertex_anims) # Interned again, since the track pass may have changed their hashes
+        self.global_seqs = tuple(self.global_seqs)
+        
+        self.geoset_ids = index_table(self.geosets)
+        self.geoset_anim_ids = index_table(self.geoset_anims)
+        self.tvertex_anim_ids = self.tvertex_anims.ids
+        self.material_ids = self.materials.ids
+        self.global_seq_ids = index_table(self.global_seqs)
         
-        return sequences
+    def animation_curves(self):
+        # Yields (owner, attribute, curve) for every animation track in the model
+        layers = itertools.chain.from_iterable(material.layers for material in self.materials)
+        owners = itertools.chain(itertools.chain.from_iterable(self.objects.values()), self.cameras, self.geoset_anims, layers, self.tvertex_anims)
+        for owner in owners:
+            for attr, value in list(vars(owner).items()):
+                if isinstance(value, War3AnimationCurve):
+                    yield owner, attr, value
+                    
+    def eliminate_redundant_tracks(self):
+        # Tracks that never leave their default value are dropped, constant tracks become static values
+        # where the format has one, and keys that repeat their neighbours are removed from the rest.
+        node_defaults = {'anim_loc': (0, 0, 0), 'anim_rot': (1, 0, 0, 0), 'anim_scale': (1, 1, 1), 'visibility': (1,)}
+        static_values = {
+            War3Light: {'intensity_anim': 'intensity', 'amb_intensity_anim': 'amb_intensity', 'atten_start_anim': 'atten_start', 'atten_end_anim': 'atten_end', 'color_anim': 'color', 'amb_color_anim': 'amb_color'},
+            War3MaterialLayer: {'alpha_anim': 'alpha_value'}
+        }
+        
+        for owner, attr, curve in list(self.animation_curves()):
+            value = curve.constant_value()
+            if value is None:
+                curve.remove_redundant_keys(self.sequences)
+                continue
+                
+            if isinstance(owner, War3Object) and not isinstance(owner, War3Camera) and node_defaults.get(attr) == value:
+                setattr(owner, attr, None)
+            elif isinstance(owner, War3GeosetAnim) and attr == 'alpha_anim' and value == (1,):
+                setattr(owner, attr, None) # Same as the static alpha that's written without a track
+            elif attr in static_values.get(type(owner), {}) and curve.covers(self.sequences):
+                if 'color' in attr:
+                    value = tuple(reversed(value)) # Color tracks are stored in reverse
+                setattr(owner, static_values[type(owner)][attr], value if len(value) > 1 else value[0])
+                setattr(owner, attr, None)
+            else:
+                curve.remove_redundant_keys(self.sequences)
+                
+        self.global_seqs = set(curve.global_sequence for owner, attr, curve in self.animation_curves() if curve.global_sequence > 0)
         
     def register_global_sequence(self, curve):
         if curve is not None and curve.global_sequence > 0:
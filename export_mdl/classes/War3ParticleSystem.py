@@ -71,17 +71,13 @@ class War3ParticleSystem(War3Object):
         settings = obj.particle_systems[0].settings
         
         emitter = settings.mdl_particle_sys
-        self.scale_anim = War3AnimationCurve.get(obj.animation_data, 'scale', 2, model.sequences)
+        self.scale_anim = model.get_curve(obj.animation_data, 'scale', 2)
         model.register_global_sequence(self.scale_anim)
 
         if len(emitter.texture_path):
             texture = War3Texture(emitter.texture_path)
 
-            if texture in model.textures:
-                self.texture_id = model.textures.index(texture)
-            else:
-                model.textures.append(texture)
-                self.texture_id = len(model.textures) - 1
+            self.texture_id = model.textures.add(texture)
 
         self.width = obj.dimensions[0]
         self.height = obj.dimensions[1]
@@ -136,29 +132,29 @@ class War3ParticleSystem(War3Object):
         # Animated properties
         
         if settings.animation_data is not None:
-            self.emission_rate_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.emission_rate', 1, model.sequences)
+            self.emission_rate_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.emission_rate', 1)
             model.register_global_sequence(self.emission_rate_anim)
                 
-            self.speed_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.speed', 1, model.sequences)
+            self.speed_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.speed', 1)
             model.register_global_sequence(self.speed_anim)
                 
-            self.life_span_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.life_span', 1, model.sequences)
+            self.life_span_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.life_span', 1)
             model.register_global_sequence(self.life_span_anim)
                 
-            self.gravity_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.gravity', 1, model.sequences)
+            self.gravity_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.gravity', 1)
             model.register_global_sequence(self.gravity_anim)
                 
-            self.variation_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.variation', 1, model.sequences)
+            self.variation_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.variation', 1)
             model.register_global_sequence(self.variation_anim)
                 
-            self.latitude_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.latitude', 1, model.sequences)
+            self.latitude_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.latitude', 1)
             model.register_global_sequence(self.latitude_anim)
                 
-            self.longitude_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.longitude', 1, model.sequences)
+            self.longitude_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.longitude', 1)
             model.register_global_sequence(self.longitude_anim)
                 
-            self.alpha_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.alpha', 1, model.sequences)
+            self.alpha_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.alpha', 1)
             model.register_global_sequence(self.alpha_anim)
                 
-            self.ribbon_color_anim = War3AnimationCurve.get(settings.animation_data, 'mdl_particle_sys.ribbon_color', 3, model.sequences)
+            self.ribbon_color_anim = model.get_curve(settings.animation_data, 'mdl_particle_sys.ribbon_color', 3)
             model.register_global_sequence(self.ribbon_color_anim)
\ No newline at end of file
@@ -0,0 +1,39 @@
+class War3Registry:
+    # A list that interns its items: add() hands back the id of an equal item if one is already registered,
+    # so resolving textures, materials and texture anims is a dict lookup instead of a list scan.
+    # Only add() and append() grow it, which keeps the ids in step with the item positions.
+    def __init__(self, items=(), key=None):
+        self.items = []
+        self.key = key
+        self.ids = {} # Key -> id of the first item with that key
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def get_key(self, item):
+        return item if self.key is None else self.key(item)
+
+    def add(self, item):
+        key = self.get_key(item)
+        index = self.ids.get(key)
+        if index is None:
+            index = len(self.items)
+            self.ids[key] = index
+            self.items.append(item)
+        return index
+
+    def append(self, item):
+        # Always appends, like a list, since the importers refer to items by file position
+        self.ids.setdefault(self.get_key(item), len(self.items))
+        self.items.append(item)
+
+    def id(self, item):
+        return self.ids[self.get_key(item)]
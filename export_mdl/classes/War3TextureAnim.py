@@ -31,25 +31,37 @@ class War3TextureAnim:
 
     @staticmethod
     def read_mdx(model, parser):
-        pass
+        anim = War3TextureAnim()
+        tracks = parser.read_tracks(parser.read_inclusive())
+        anim.translation = tracks.get(b'KTAT')
+        anim.rotation = tracks.get(b'KTAR')
+        anim.scale = tracks.get(b'KTAS')
+        model.tvertex_anims.append(anim)
 
     def write_mdl(self, model, writer):
         pass
 
     def write_mdx(self, model, writer):
-        pass
+        writer.begin_inclusive()
+        if self.translation is not None:
+            self.translation.write_mdx(b'KTAT', writer, model)
+        if self.rotation is not None:
+            self.rotation.write_mdx(b'KTAR', writer, model)
+        if self.scale is not None:
+            self.scale.write_mdx(b'KTAS', writer, model)
+        writer.end_inclusive()
       
     @staticmethod
-    def get(anim_data, uv_node, sequences):
+    def get(anim_data, uv_node, model):
         anim = War3TextureAnim()
         if anim_data.action:
             if len(uv_node.inputs) > 1: # 2.81 Mapping Node
-                anim.translation = War3AnimationCurve.get(anim_data, 'nodes["%s"].inputs[1].default_value' % uv_node.name, 3, sequences)
-                anim.rotation = War3AnimationCurve.get(anim_data, 'nodes["%s"].inputs[2].default_value' % uv_node.name, 3, sequences)
-                anim.scale = War3AnimationCurve.get(anim_data, 'nodes["%s"].inputs[3].default_value' % uv_node.name, 3, sequences)
+                anim.translation = model.get_curve(anim_data, 'nodes["%s"].inputs[1].default_value' % uv_node.name, 3)
+                anim.rotation = model.get_curve(anim_data, 'nodes["%s"].inputs[2].default_value' % uv_node.name, 3)
+                anim.scale = model.get_curve(anim_data, 'nodes["%s"].inputs[3].default_value' % uv_node.name, 3)
             else:
-                anim.translation = War3AnimationCurve.get(anim_data, 'nodes["%s"].translation' % uv_node.name, 3, sequences)
-                anim.rotation = War3AnimationCurve.get(anim_data, 'nodes["%s"].rotation' % uv_node.name, 3, sequences)
-                anim.scale = War3AnimationCurve.get(anim_data, 'nodes["%s"].scale' % uv_node.name, 3, sequences)
+                anim.translation = model.get_curve(anim_data, 'nodes["%s"].translation' % uv_node.name, 3)
+                anim.rotation = model.get_curve(anim_data, 'nodes["%s"].rotation' % uv_node.name, 3)
+                anim.scale = model.get_curve(anim_data, 'nodes["%s"].scale' % uv_node.name, 3)
                     
         return anim if any((anim.translation, anim.rotation, anim.scale)) else None
\ No newline at end of file
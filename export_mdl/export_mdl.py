@@ -1,4 +1,3 @@
-import itertools
 import getpass
 import datetime
 
@@ -19,31 +18,65 @@ from .utils import *
 # ------------------ #
 
 class MDLWriter:
-    def __init__(self, path):
+    def __init__(self, path, buffer_size=1 << 16):
         self.indentation = 0
+        self.indents = [""] # Cached indentation prefixes, one per depth
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_size = buffer_size # Characters collected before they are handed to the file
         self.file = open(path, 'w')
-        pass
 
     def __del__(self):
-        self.file.close()
+        self.close()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def flush(self):
+        self.file.write("".join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def emit(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def indent(self, depth):
+        while len(self.indents) <= depth:
+            self.indents.append("\t" * len(self.indents))
+        return self.indents[depth]
 
     def comment(self, value):
-        self.file.write("%s// %s\n" % ("\t" * self.indentation, value))
+        self.emit("%s// %s\n" % (self.indent(self.indentation), value))
 
     def write(self, value):
-        self.file.write("%s%s,\n" % ("\t" * self.indentation, value))
+        self.emit("%s%s,\n" % (self.indent(self.indentation), value))
+
+    def write_lines(self, lines):
+        # Same as calling write() for every line, but formats the whole batch in one join
+        prefix = self.indent(self.indentation)
+        self.emit("".join("%s%s,\n" % (prefix, line) for line in lines))
+
+    def write_block(self, name, value, lines):
+        self.begin_scope(name, value)
+        self.write_lines(lines)
+        self.end_scope()
 
     def begin_scope(self, name, value = None):
         if (value is not None):
-            self.file.write("%s%s %s {\n" % ("\t" * self.indentation, name, value))
+            self.emit("%s%s %s {\n" % (self.indent(self.indentation), name, value))
         else:
-            self.file.write("%s%s {\n" % ("\t" * self.indentation, name))
+            self.emit("%s%s {\n" % (self.indent(self.indentation), name))
         
         self.indentation += 1
 
     def end_scope(self):
         self.indentation -= 1
-        self.file.write("%s}\n" % ("\t" * self.indentation))
+        self.emit("%s}\n" % self.indent(self.indentation))
   
 def write_billboard(writer, billboarded, billboard_lock):
     for flag, axis in zip(billboard_lock, ('Z', 'Y', 'X')):
@@ -64,6 +97,9 @@ def save(operator, context, settings, filepath="", mdl_version=800):
     
     scene.frame_set(current_frame)
 
+    write_model(model, filepath, mdl_version)
+    
+def write_model(model, filepath, mdl_version=800):
     writer = MDLWriter(filepath)
     
     date = datetime.datetime.now().strftime("%a %b %d %H:%M:%S %Y")
@@ -182,7 +218,7 @@ def save(operator, context, settings, filepath="", mdl_version=800):
                     writer.write("static TextureID 0")
                     
                 if layer.texture_anim is not None:
-                    writer.write("TVertexAnimId %d" % model.tvertex_anims.index(layer.texture_anim))
+                    writer.write("TVertexAnimId %d" % model.tvertex_anim_ids[layer.texture_anim])
                 if layer.alpha_anim is not None:
                     layer.alpha_anim.write_mdl("Alpha", writer, model)
                 else:
@@ -209,42 +245,24 @@ def save(operator, context, settings, filepath="", mdl_version=800):
             writer.end_scope()
         writer.end_scope()
     
-    material_names = [mat.name for mat in model.materials]
-    
     # GEOSETS
     if len(model.geosets):
         for geoset in model.geosets:
             writer.begin_scope("Geoset")
             # Vertices
-            writer.begin_scope("Vertices", "%d" % len(geoset.vertices))
-            for vertex in geoset.vertices:
-                writer.write("{%s, %s, %s}" % tuple(map(f2s, vertex[0])))
-            writer.end_scope()
+            writer.write_block("Vertices", "%d" % len(geoset.vertices), format_vectors([vertex[0] for vertex in geoset.vertices]))
             # Normals
-            writer.begin_scope("Normals", "%d" % len(geoset.vertices))
-            for normal in geoset.vertices:
-                writer.write("{%s, %s, %s}" % tuple(map(f2s, normal[1])))
-            writer.end_scope()
+            writer.write_block("Normals", "%d" % len(geoset.vertices), format_vectors([normal[1] for normal in geoset.vertices]))
             
             # TVertices
-            writer.begin_scope("TVertices", "%d" % len(geoset.vertices))
-            for tvertex in geoset.vertices:
-                writer.write("{%s, %s}" % tuple(map(f2s, tvertex[2])))
-            writer.end_scope()
+            writer.write_block("TVertices", "%d" % len(geoset.vertices), format_vectors([tvertex[2] for tvertex in geoset.vertices]))
             
             # VertexGroups
-            writer.begin_scope("VertexGroup")
-            for vertgroup in geoset.vertices:
-                writer.write("%d" % vertgroup[3])
-            writer.end_scope()
+            writer.write_block("VertexGroup", None, ("%d" % vertgroup[3] for vertgroup in geoset.vertices))
             
             # Faces
             writer.begin_scope("Faces", "%d %d" % (len(geoset.triangles), len(geoset.triangles) * 3))
-            writer.begin_scope("Triangles")
-            for triangle in geoset.triangles:
-                writer.write("{%d, %d, %d}" % triangle[:])
-                
-            writer.end_scope()
+            writer.write_block("Triangles", None, ("{%d, %d, %d}" % triangle[:] for triangle in geoset.triangles))
             writer.end_scope()
             
             writer.begin_scope("Groups", "%d %d" % (len(geoset.matrices), sum(len(mtrx) for mtrx in geoset.matrices)))
@@ -266,7 +284,7 @@ def save(operator, context, settings, filepath="", mdl_version=800):
                 
                 writer.end_scope()
             
-            writer.write("MaterialID %d" % material_names.index(geoset.mat_name))
+            writer.write("MaterialID %d" % model.material_ids[geoset.mat_name])
 
             writer.end_scope()
 
@@ -288,7 +306,7 @@ def save(operator, context, settings, filepath="", mdl_version=800):
             elif vertexcolor is not None:
                 writer.write("static Color {%s, %s, %s}" % tuple(map(f2s, reversed(vertexcolor[:3]))))
                 
-            writer.write("GeosetId %d" % model.geosets.index(anim.geoset))
+            writer.write("GeosetId %d" % model.geoset_ids[anim.geoset])
 
             writer.end_scope()
         
@@ -307,14 +325,14 @@ def save(operator, context, settings, filepath="", mdl_version=800):
         if hasattr(bone, "billboarded"):
             write_billboard(writer, bone.billboarded, bone.billboard_lock)
         
-        children = [g for g in model.geosets if bone.name in itertools.chain.from_iterable(g.matrices)]
+        children = model.bone_geosets.get(bone.name, ())
         if len(children) == 1:
-            writer.write("GeosetId %d" % model.geosets.index(children[0]))
+            writer.write("GeosetId %d" % model.geoset_ids[children[0]])
         else:
             writer.write("GeosetId -1")
             
         if bone.name in model.geoset_anim_map.keys():
-            writer.write("GeosetAnimId %d" % model.geoset_anims.index(model.geoset_anim_map[bone.name]))
+            writer.write("GeosetAnimId %d" % model.geoset_anim_ids[model.geoset_anim_map[bone.name]])
         else:
             writer.write("GeosetAnimId None")
             
@@ -602,7 +620,7 @@ def save(operator, context, settings, filepath="", mdl_version=800):
         else:
             writer.write("static Color {%s, %s, %s}" % tuple(map(f2s, reversed(psys.ribbon_color))))
             
-        writer.write("static TextureSlot %d" % model.textures[psys.texture_id])
+        writer.write("static TextureSlot %d" % psys.texture_id)
         visibility = psys.visibility
         if visibility is not None:
             visibility.write_mdl("Visibility", writer, model)
@@ -611,10 +629,8 @@ def save(operator, context, settings, filepath="", mdl_version=800):
         writer.write("Gravity %s" % f2s(rnd(psys.gravity)))
         writer.write("Rows %d" % psys.rows)
         writer.write("Columns %d" % psys.cols)
-        for material in model.materials:
-            if material.name == psys.ribbon_material.name:
-                writer.write("MaterialID %d" % model.materials.index(material))
-                break
+        if psys.ribbon_material.name in model.material_ids:
+            writer.write("MaterialID %d" % model.material_ids[psys.ribbon_material.name])
         writer.end_scope()
         
     # CAMERAS    
@@ -660,6 +676,8 @@ def save(operator, context, settings, filepath="", mdl_version=800):
         if collider.type == 'Sphere':
             writer.write("BoundsRadius %s" % f2s(rnd(collider.radius)))
         writer.end_scope()
+        
+    writer.close()
                 
                 
     
\ No newline at end of file
@@ -0,0 +1,454 @@
+import sys
+import struct
+import itertools
+
+from array import array
+
+from .classes.War3Model import War3Model
+
+from .utils import *
+
+# Binary counterpart of export_mdl. Chunks are written in the order the Warcraft 3 tools use,
+# and every value is taken from the same War3Model the MDL writer uses.
+
+node_flags = {
+    'helper': 0x0,
+    'bone': 0x100,
+    'light': 0x200,
+    'eventobject': 0x400,
+    'attachment': 0x800,
+    'particle': 0x1000,
+    'collisionshape': 0x2000,
+    'ribbon': 0x4000
+}
+
+light_type_ids = {
+    'Omnidirectional': 0,
+    'Directional': 1,
+    'Ambient': 2
+}
+
+particle_filter_mode_ids = {
+    'None': 0,
+    'Blend': 0,
+    'Additive': 1,
+    'AddAlpha': 1,
+    'Modulate': 2,
+    'Modulate2x': 3,
+    'Transparent': 4,
+    'AlphaKey': 4
+}
+
+class MDXWriter:
+    def __init__(self, path):
+        self.path = path
+        self.buffer = bytearray()
+        self.sizes = [] # Offsets of size fields that are still waiting for their value
+
+    def pack(self, fmt, *values):
+        self.buffer += struct.pack('<' + fmt, *values)
+
+    def write_tag(self, tag):
+        self.buffer += tag
+
+    def write_array(self, typecode, values):
+        data = array(typecode, values)
+        if sys.byteorder == 'big':
+            data.byteswap()
+        self.buffer += data.tobytes()
+
+    def write_string(self, value, size):
+        encoded = (value or "").encode('utf-8')[:size - 1]
+        self.buffer += encoded + bytes(size - len(encoded))
+
+    def write_extent(self, min_ext, max_ext):
+        self.pack('7f', calc_bounds_radius(min_ext, max_ext), *(tuple(min_ext) + tuple(max_ext)))
+
+    def begin_chunk(self, tag):
+        self.write_tag(tag)
+        self.sizes.append(len(self.buffer))
+        self.pack('I', 0)
+
+    def end_chunk(self):
+        offset = self.sizes.pop()
+        struct.pack_into('<I', self.buffer, offset, len(self.buffer) - offset - 4) # Chunk sizes exclude the header
+
+    def begin_inclusive(self):
+        self.sizes.append(len(self.buffer))
+        self.pack('I', 0)
+
+    def end_inclusive(self):
+        offset = self.sizes.pop()
+        struct.pack_into('<I', self.buffer, offset, len(self.buffer) - offset) # Inclusive sizes count the size field itself
+
+    def close(self):
+        with open(self.path, 'wb') as file:
+            file.write(self.buffer)
+
+def bone_name(name):
+    name = name.replace('.', '_')
+    if not name.lower().startswith("bone"):
+        name = "Bone_"+name
+    return name
+
+def billboard_flags(node):
+    flags = 0
+    if getattr(node, "billboarded", False):
+        flags |= 0x8
+    for flag, bit in zip(getattr(node, "billboard_lock", ()), (0x40, 0x20, 0x10)): # Locks are stored Z, Y, X
+        if flag:
+            flags |= bit
+    return flags
+
+def write_node(writer, model, node, name, flags):
+    writer.begin_inclusive()
+    writer.write_string(name, 80)
+    parent = model.object_indices[node.parent] if node.parent is not None else 0xFFFFFFFF
+    writer.pack('III', model.object_indices[node.name], parent, flags | billboard_flags(node))
+    if node.anim_loc is not None:
+        node.anim_loc.write_mdx(b'KGTR', writer, model)
+    if node.anim_rot is not None:
+        node.anim_rot.write_mdx(b'KGRT', writer, model)
+    if node.anim_scale is not None:
+        node.anim_scale.write_mdx(b'KGSC', writer, model)
+    writer.end_inclusive()
+
+def save(operator, context, settings, filepath="", mdx_version=800):
+
+    scene = context.scene
+
+    current_frame = scene.frame_current
+    scene.frame_set(0)
+
+    model = War3Model(context)
+    model.from_scene(context, settings, operator.report)
+
+    scene.frame_set(current_frame)
+
+    for geoset in model.geosets:
+        # MDX stores face indices as 16 bit and vertex groups as 8 bit values
+        if len(geoset.vertices) > 0xFFFF or len(geoset.matrices) > 0xFF:
+            operator.report({'ERROR'}, "Geoset with material %s is too large for the MDX format, export it as MDL instead." % geoset.mat_name)
+            return {'CANCELLED'}
+
+    write_model(model, filepath, mdx_version)
+    return {'FINISHED'}
+
+def write_model(model, filepath, mdx_version=800):
+    writer = MDXWriter(filepath)
+    writer.write_tag(b'MDLX')
+
+    writer.begin_chunk(b'VERS')
+    writer.pack('I', mdx_version)
+    writer.end_chunk()
+
+    # HEADER
+    writer.begin_chunk(b'MODL')
+    writer.write_string(model.name, 80)
+    writer.write_string("", 260) # Animation file name
+    writer.write_extent(model.global_extents_min, model.global_extents_max)
+    writer.pack('I', 150) # Blend time
+    writer.end_chunk()
+
+    # SEQUENCES
+    writer.begin_chunk(b'SEQS')
+    for sequence in model.sequences:
+        writer.write_string(sequence.name, 80)
+        move_speed = sequence.movement_speed if 'walk' in sequence.name.lower() else 0
+        writer.pack('IIfIfI', int(sequence.start), int(sequence.end), move_speed, 0x1 if sequence.non_looping else 0, sequence.rarity, 0)
+        writer.write_extent(model.global_extents_min, model.global_extents_max)
+    writer.end_chunk()
+
+    # GLOBAL SEQUENCES
+    if len(model.global_seqs):
+        writer.begin_chunk(b'GLBS')
+        writer.write_array('I', model.global_seqs)
+        writer.end_chunk()
+
+    # MATERIALS
+    if len(model.materials):
+        writer.begin_chunk(b'MTLS')
+        for material in model.materials:
+            material.write_mdx(model, writer)
+        writer.end_chunk()
+
+    # TEXTURES
+    if len(model.textures):
+        writer.begin_chunk(b'TEXS')
+        for texture in model.textures:
+            writer.pack('I', texture.replaceable_id if texture.is_replaceable else 0)
+            writer.write_string(None if texture.is_replaceable else texture.image_path, 260)
+            writer.pack('I', 0x3) # WrapWidth, WrapHeight
+        writer.end_chunk()
+
+    # TEXTURE ANIMATIONS
+    if len(model.tvertex_anims):
+        writer.begin_chunk(b'TXAN')
+        for uv_anim in model.tvertex_anims:
+            uv_anim.write_mdx(model, writer)
+        writer.end_chunk()
+
+    # GEOSETS
+    if len(model.geosets):
+        writer.begin_chunk(b'GEOS')
+        for geoset in model.geosets:
+            writer.begin_inclusive()
+
+            writer.write_tag(b'VRTX')
+            writer.pack('I', len(geoset.vertices))
+            writer.write_array('f', itertools.chain.from_iterable(vertex[0] for vertex in geoset.vertices))
+
+            writer.write_tag(b'NRMS')
+            writer.pack('I', len(geoset.vertices))
+            writer.write_array('f', itertools.chain.from_iterable(vertex[1] for vertex in geoset.vertices))
+
+            writer.write_tag(b'PTYP')
+            writer.pack('II', 1, 4) # One face group, made of triangles
+            writer.write_tag(b'PCNT')
+            writer.pack('II', 1, len(geoset.triangles) * 3)
+            writer.write_tag(b'PVTX')
+            writer.pack('I', len(geoset.triangles) * 3)
+            writer.write_array('H', itertools.chain.from_iterable(geoset.triangles))
+
+            writer.write_tag(b'GNDX')
+            writer.pack('I', len(geoset.vertices))
+            writer.write_array('B', (vertex[3] for vertex in geoset.vertices))
+
+            writer.write_tag(b'MTGC')
+            writer.pack('I', len(geoset.matrices))
+            writer.write_array('I', (len(matrix) for matrix in geoset.matrices))
+
+            writer.write_tag(b'MATS')
+            writer.pack('I', sum(len(matrix) for matrix in geoset.matrices))
+            writer.write_array('I', (model.object_indices[g] for g in itertools.chain.from_iterable(geoset.matrices)))
+
+            writer.pack('III', model.material_ids[geoset.mat_name], 0, 0) # Material, selection group, selection flags
+            writer.write_extent(geoset.min_extent, geoset.max_extent)
+
+            # As of right now, we just use the geoset bounds for every sequence.
+            writer.pack('I', len(model.sequences))
+            for sequence in model.sequences:
+                writer.write_extent(geoset.min_extent, geoset.max_extent)
+
+            writer.write_tag(b'UVAS')
+            writer.pack('I', 1)
+            writer.write_tag(b'UVBS')
+            writer.pack('I', len(geoset.vertices))
+            writer.write_array('f', itertools.chain.from_iterable(vertex[2] for vertex in geoset.vertices))
+
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # GEOSET ANIMS
+    if len(model.geoset_anims):
+        writer.begin_chunk(b'GEOA')
+        for anim in model.geoset_anims:
+            color = (1.0, 1.0, 1.0)
+            if anim.color is not None:
+                color = tuple(reversed(anim.color[:3]))
+            use_color = anim.color is not None or anim.color_anim is not None
+
+            writer.begin_inclusive()
+            writer.pack('fI3fI', 1.0, 0x2 if use_color else 0, *(color + (model.geoset_ids[anim.geoset],)))
+            if anim.alpha_anim is not None:
+                anim.alpha_anim.write_mdx(b'KGAO', writer, model)
+            if anim.color_anim is not None:
+                anim.color_anim.write_mdx(b'KGAC', writer, model)
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # BONES
+    if len(model.objects['bone']):
+        writer.begin_chunk(b'BONE')
+        for bone in model.objects['bone']:
+            write_node(writer, model, bone, bone_name(bone.name), node_flags['bone'])
+
+            children = model.bone_geosets.get(bone.name, ())
+            geoset_id = model.geoset_ids[children[0]] if len(children) == 1 else -1
+            geoset_anim_id = -1
+            if bone.name in model.geoset_anim_map.keys():
+                geoset_anim_id = model.geoset_anim_ids[model.geoset_anim_map[bone.name]]
+            writer.pack('ii', geoset_id, geoset_anim_id)
+        writer.end_chunk()
+
+    # LIGHTS
+    if len(model.objects['light']):
+        writer.begin_chunk(b'LITE')
+        for light in model.objects['light']:
+            writer.begin_inclusive()
+            write_node(writer, model, light, light.name, node_flags['light'])
+            writer.pack('Iff', light_type_ids[light.type], light.atten_start, light.atten_end)
+            writer.pack('3ff', *(tuple(reversed(light.color[:3])) + (light.intensity,)))
+            writer.pack('3ff', *(tuple(reversed(light.amb_color[:3])) + (light.amb_intensity,)))
+
+            if light.atten_start_anim is not None:
+                light.atten_start_anim.write_mdx(b'KLAS', writer, model)
+            if light.atten_end_anim is not None:
+                light.atten_end_anim.write_mdx(b'KLAE', writer, model)
+            if light.color_anim is not None:
+                light.color_anim.write_mdx(b'KLAC', writer, model)
+            if light.intensity_anim is not None:
+                light.intensity_anim.write_mdx(b'KLAI', writer, model)
+            if light.amb_intensity_anim is not None:
+                light.amb_intensity_anim.write_mdx(b'KLBI', writer, model)
+            if light.amb_color_anim is not None:
+                light.amb_color_anim.write_mdx(b'KLBC', writer, model)
+            if light.visibility is not None:
+                light.visibility.write_mdx(b'KLAV', writer, model)
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # HELPERS
+    if len(model.objects['helper']):
+        writer.begin_chunk(b'HELP')
+        for helper in model.objects['helper']:
+            write_node(writer, model, helper, bone_name(helper.name), node_flags['helper'])
+        writer.end_chunk()
+
+    # ATTACHMENT POINTS
+    if len(model.objects['attachment']):
+        writer.begin_chunk(b'ATCH')
+        for i, attachment in enumerate(model.objects['attachment']):
+            writer.begin_inclusive()
+            write_node(writer, model, attachment, attachment.name, node_flags['attachment'])
+            writer.write_string("", 260) # Path
+            writer.pack('I', i)
+            if attachment.visibility is not None:
+                attachment.visibility.write_mdx(b'KATV', writer, model)
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # PIVOT POINTS
+    if len(model.objects_all):
+        writer.begin_chunk(b'PIVT')
+        writer.write_array('f', itertools.chain.from_iterable(object.pivot for object in model.objects_all))
+        writer.end_chunk()
+
+    # MODEL EMITTERS
+    if len(model.objects['particle']):
+        writer.begin_chunk(b'PREM')
+        for psys in model.objects['particle']:
+            writer.begin_inclusive()
+            write_node(writer, model, psys, psys.name, node_flags['particle'] | 0x8000) # EmitterUsesMDL
+            writer.pack('4f', psys.emission_rate, psys.gravity, psys.longitude, psys.latitude)
+            writer.write_string(psys.model_path, 260)
+            writer.pack('2f', psys.life_span, psys.speed)
+
+            if psys.emission_rate_anim is not None:
+                psys.emission_rate_anim.write_mdx(b'KPEE', writer, model)
+            if psys.gravity_anim is not None:
+                psys.gravity_anim.write_mdx(b'KPEG', writer, model)
+            if psys.longitude_anim is not None:
+                psys.longitude_anim.write_mdx(b'KPLN', writer, model)
+            if psys.latitude_anim is not None:
+                psys.latitude_anim.write_mdx(b'KPLT', writer, model)
+            if psys.life_span_anim is not None:
+                psys.life_span_anim.write_mdx(b'KPEL', writer, model)
+            if psys.speed_anim is not None:
+                psys.speed_anim.write_mdx(b'KPES', writer, model)
+            if psys.visibility is not None:
+                psys.visibility.write_mdx(b'KPEV', writer, model)
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # PARTICLE EMITTERS
+    if len(model.objects['particle2']):
+        writer.begin_chunk(b'PRE2')
+        for psys in model.objects['particle2']:
+            flags = node_flags['particle']
+            for enabled, bit in ((psys.unshaded, 0x8000), (psys.sort_far_z, 0x10000), (psys.line_emitter, 0x20000), (psys.unfogged, 0x40000), (psys.model_space, 0x80000), (psys.xy_quad, 0x100000)):
+                if enabled:
+                    flags |= bit
+
+            head_or_tail = 0
+            if psys.head and psys.tail:
+                head_or_tail = 2
+            elif psys.tail:
+                head_or_tail = 1
+
+            writer.begin_inclusive()
+            write_node(writer, model, psys, psys.name, flags)
+            # Width is the Y and length the X dimension, as in export_mdl
+            writer.pack('8f', psys.speed, psys.variation, psys.latitude, psys.gravity, psys.life_span, psys.emission_rate, psys.dimensions[1], psys.dimensions[0])
+            writer.pack('4I2f', particle_filter_mode_ids[psys.filter_mode], psys.rows, psys.cols, head_or_tail, psys.tail_length, psys.time)
+            writer.pack('9f', *(tuple(reversed(psys.start_color)) + tuple(reversed(psys.mid_color)) + tuple(reversed(psys.end_color))))
+            writer.pack('3B', int(psys.start_alpha), int(psys.mid_alpha), int(psys.end_alpha))
+            writer.pack('3f', psys.start_scale, psys.mid_scale, psys.end_scale)
+            writer.pack('12I', psys.head_life_start, psys.head_life_end, psys.head_life_repeat,
+                        psys.head_decay_start, psys.head_decay_end, psys.head_decay_repeat,
+                        psys.tail_life_start, psys.tail_life_end, psys.tail_life_repeat,
+                        psys.tail_decay_start, psys.tail_decay_end, psys.tail_decay_repeat)
+            writer.pack('iiiI', psys.texture_id, 0, psys.priority_plane, 0) # Texture, squirt, priority plane, replaceable id
+
+            if psys.speed_anim is not None:
+                psys.speed_anim.write_mdx(b'KP2S', writer, model)
+            if psys.variation_anim is not None:
+                psys.variation_anim.write_mdx(b'KP2R', writer, model)
+            if psys.latitude_anim is not None:
+                psys.latitude_anim.write_mdx(b'KP2L', writer, model)
+            if psys.gravity_anim is not None:
+                psys.gravity_anim.write_mdx(b'KP2G', writer, model)
+            if psys.emission_rate_anim is not None:
+                psys.emission_rate_anim.write_mdx(b'KP2E', writer, model)
+            if psys.scale_anim is not None:
+                psys.scale_anim.write_mdx(b'KP2W', writer, model, 1, psys.dimensions[1])
+                psys.scale_anim.write_mdx(b'KP2N', writer, model, 0, psys.dimensions[0])
+            if psys.visibility is not None:
+                psys.visibility.write_mdx(b'KP2V', writer, model)
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # RIBBON EMITTERS
+    if len(model.objects['ribbon']):
+        writer.begin_chunk(b'RIBB')
+        for psys in model.objects['ribbon']:
+            material_id = model.material_ids.get(psys.ribbon_material.name, 0)
+
+            writer.begin_inclusive()
+            write_node(writer, model, psys, psys.name, node_flags['ribbon'])
+            writer.pack('3f', psys.dimensions[0]/2, psys.dimensions[0]/2, psys.alpha)
+            writer.pack('3f', *reversed(psys.ribbon_color))
+            writer.pack('fIIIIif', psys.life_span, psys.texture_id, int(psys.emission_rate), psys.rows, psys.cols, material_id, psys.gravity)
+
+            if psys.alpha_anim is not None:
+                psys.alpha_anim.write_mdx(b'KRAL', writer, model)
+            if psys.ribbon_color_anim is not None:
+                psys.ribbon_color_anim.write_mdx(b'KRCO', writer, model)
+            if psys.visibility is not None:
+                psys.visibility.write_mdx(b'KRVS', writer, model)
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # CAMERAS
+    if len(model.cameras):
+        writer.begin_chunk(b'CAMS')
+        for camera in model.cameras:
+            writer.begin_inclusive()
+            writer.write_string(camera.name, 80)
+            writer.pack('3f', *camera.pivot)
+            writer.pack('3f', camera.field_of_view, camera.far_clip, camera.near_clip)
+            writer.pack('3f', *camera.target)
+            writer.end_inclusive()
+        writer.end_chunk()
+
+    # EVENT OBJECTS
+    if len(model.objects['eventobject']):
+        writer.begin_chunk(b'EVTS')
+        for event in model.objects['eventobject']:
+            write_node(writer, model, event, event.name, node_flags['eventobject'])
+            if event.track is not None:
+                event.track.write_mdx(b'KEVT', writer, model)
+        writer.end_chunk()
+
+    # COLLISION SHAPES
+    if len(model.objects['collisionshape']):
+        writer.begin_chunk(b'CLID')
+        for collider in model.objects['collisionshape']:
+            write_node(writer, model, collider, collider.name, node_flags['collisionshape'])
+            if collider.type == 'Box':
+                writer.pack('I6f', 0, *itertools.chain.from_iterable(collider.verts[:2]))
+            else:
+                writer.pack('I3ff', 2, *(tuple(collider.verts[0]) + (collider.radius,)))
+        writer.end_chunk()
+
+    writer.close()
@@ -16,11 +16,25 @@ from .classes.War3EventObject import War3EventObject
 from .classes.War3GeosetAnim import War3GeosetAnim
 
 import os.path
+import itertools
+
+from array import array
+
+from .utils import np
 
 def parse_vector(str, as_int = False):
     values = str.rstrip('},').lstrip('{').split(',')
     return tuple(map(lambda x: int(x) if as_int else float(x), values))
 
+block_separators = str.maketrans('{},', '   ')
+
+def parse_block(text, as_int = False):
+    # Parses every number in a block of vector lines at once, into a flat array
+    text = text.translate(block_separators)
+    if np is not None:
+        return np.fromstring(text, dtype=np.int32 if as_int else np.float32, sep=' ')
+    return array('i' if as_int else 'f', map(int if as_int else float, text.split()))
+
 class MDLParser:
     def __init__(self, path):
          self.file = open(path, 'r')
@@ -40,6 +54,22 @@ class MDLParser:
     def parse_header(self):
         pass
 
+    def read_block(self, count):
+        # Reads the next 'count' lines in one go, then steps out of the enclosing scope
+        text = ''.join(itertools.islice(self.file, count))
+        self.readline()
+        return text
+
+    def read_scope(self):
+        # Reads every line up to the closing brace of the current scope, for blocks without a count
+        lines = []
+        for line in self.file:
+            if line.lstrip().startswith('}'):
+                break
+            lines.append(line)
+        self.scope -= 1
+        return ''.join(lines)
+
     def parse_geoset(self):
         print("Parsing geoset")
         geoset = War3Geoset()
@@ -51,41 +81,24 @@ class MDLParser:
             if token == 'Vertices':
                 count = int(values[0])
                 print("Parsing %d vertices" % count)
-                for i in range(count):
-                    vertex = parse_vector(self.readline())
-                    geoset.vertices.append((vertex, (0, 1, 0), (0, 0), 0))
+                geoset.positions = parse_block(self.read_block(count))
             elif token == 'Normals':
                 count = int(values[0])
                 print("Parsing %d normals" % count)
-                for i in range(count):
-                    vertex = list(geoset.vertices[i])
-                    vertex[1] = parse_vector(self.readline())
-                    geoset.vertices[i] = tuple(vertex)
+                geoset.normals = parse_block(self.read_block(count))
             elif token == 'TVertices':
                 count = int(values[0])
                 print("Parsing %d UVs" %count)
-                for i in range(count):
-                    vertex = list(geoset.vertices[i])
-                    vertex[2] = parse_vector(self.readline())
-                    geoset.vertices[i] = tuple(vertex)
+                geoset.uvs = parse_block(self.read_block(count))
             elif token == 'VertexGroup':
-                line = self.readline().strip()
-                i = 0
                 print ("Parsing vertex groups")
-                while line != '}':
-                    vertex = list(geoset.vertices[i])
-                    vertex[3] = int(line)
-                    geoset.vertices[i] = tuple(vertex)
-                    i += 1
-                    line = self.readline().strip()
+                geoset.groups = parse_block(self.read_scope(), True)
             elif token == 'Faces':
                 print("Parsing triangles")
-                geoset.triangles = []
-                tri_count = int(values[0].split(' ')[0])
+                line_count = int(values[0].split(' ')[0])
                 self.readline() # One line is for the Triangles block - ignore this
-                for i in range(tri_count):
-                    # Triangle indices are stored in a giant vector
-                    geoset.triangles += list(parse_vector(self.readline(), True))
+                # Triangle indices are stored in a giant vector, read it straight into a flat index array
+                geoset.triangles = parse_block(self.read_block(line_count), True)
             elif token == 'Groups':
                 count = int(values[0])
                 for i in range(count):
@@ -137,6 +150,10 @@ class MDLParser:
             curve.global_sequence = int(line.split(' ')[1])
             line = self.readline()
 
+        times = []
+        keys = []
+        in_tans = []
+        out_tans = []
         for i in range(num_frames):
             token, *values = line.split(' ', 1)
             frame = int(token.rstrip(':'))
@@ -152,9 +169,10 @@ class MDLParser:
                     # Blender quaternions have the form WXYZ, while MDL has XYZW
                     value = (value[3], value[0], value[1], value[2])
 
-                curve.keyframes[frame] = value
+                keys.append(value)
             else:
-                curve.keyframes[frame] = (1,)
+                keys.append((1,))
+            times.append(frame)
 
             if has_tangents:
                 in_tan = parse_vector(self.readline().split(' ', 1)[1])
@@ -164,11 +182,15 @@ class MDLParser:
                     in_tan = (in_tan[3], in_tan[0], in_tan[1], in_tan[2])
                     out_tan = (out_tan[3], out_tan[0], out_tan[1], out_tan[2])
 
-                curve.handles_left[frame] = in_tan
-                curve.handles_right[frame] = out_tan
+                in_tans.append(in_tan)
+                out_tans.append(out_tan)
 
             line = self.readline()
 
+        if has_tangents:
+            curve.set_keys(times, keys, in_tans, out_tans)
+        else:
+            curve.set_keys(times, keys)
         return curve
 
     def parse_node(self, node, token, values):
@@ -708,7 +730,7 @@ def load(operator, context, settings, filepath=""):
     print("Parsing...")
     parser.parse(model)
     print("Converting to scene...")
-    model.to_scene(context, settings.global_matrix, os.path.dirname(filepath))
+    model.to_scene(context, settings.global_matrix, os.path.dirname(filepath), settings.convert_to_quads)
     
 
 
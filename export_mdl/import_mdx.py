@@ -0,0 +1,562 @@
+from .classes.War3Model import War3Model
+from .classes.War3Bone import War3Bone
+from .classes.War3Object import War3Object
+from .classes.War3Material import War3Material
+from .classes.War3AnimationSequence import War3AnimationSequence
+from .classes.War3AnimationCurve import War3AnimationCurve
+from .classes.War3Geoset import War3Geoset
+from .classes.War3MaterialLayer import War3MaterialLayer, mdx_filter_mode_ids
+from .classes.War3Texture import War3Texture
+from .classes.War3Camera import War3Camera
+from .classes.War3TextureAnim import War3TextureAnim
+from .classes.War3Light import War3Light
+from .classes.War3ParticleSystem import War3ParticleSystem
+from .classes.War3CollisionShape import War3CollisionShape
+from .classes.War3EventObject import War3EventObject
+from .classes.War3GeosetAnim import War3GeosetAnim
+
+import os.path
+import sys
+import mmap
+import struct
+
+from array import array
+
+# Track tag -> (curve type, values per key, typecode)
+track_types = {
+    b'KGTR': ('Translation', 3, 'f'),
+    b'KGRT': ('Rotation', 4, 'f'),
+    b'KGSC': ('Scaling', 3, 'f'),
+    b'KGAO': ('Alpha', 1, 'f'),
+    b'KGAC': ('Color', 3, 'f'),
+    b'KMTA': ('Alpha', 1, 'f'),
+    b'KMTF': ('TextureID', 1, 'i'),
+    b'KTAT': ('Translation', 3, 'f'),
+    b'KTAR': ('Rotation', 4, 'f'),
+    b'KTAS': ('Scaling', 3, 'f'),
+    b'KLAS': ('AttenuationStart', 1, 'f'),
+    b'KLAE': ('AttenuationEnd', 1, 'f'),
+    b'KLAC': ('Color', 3, 'f'),
+    b'KLAI': ('Intensity', 1, 'f'),
+    b'KLBI': ('AmbIntensity', 1, 'f'),
+    b'KLBC': ('Color', 3, 'f'),
+    b'KLAV': ('Visibility', 1, 'f'),
+    b'KATV': ('Visibility', 1, 'f'),
+    b'KPEE': ('EmissionRate', 1, 'f'),
+    b'KPEG': ('Gravity', 1, 'f'),
+    b'KPLN': ('Longitude', 1, 'f'),
+    b'KPLT': ('Latitude', 1, 'f'),
+    b'KPEL': ('LifeSpan', 1, 'f'),
+    b'KPES': ('InitVelocity', 1, 'f'),
+    b'KPEV': ('Visibility', 1, 'f'),
+    b'KP2S': ('Speed', 1, 'f'),
+    b'KP2R': ('Variation', 1, 'f'),
+    b'KP2L': ('Latitude', 1, 'f'),
+    b'KP2G': ('Gravity', 1, 'f'),
+    b'KP2E': ('EmissionRate', 1, 'f'),
+    b'KP2W': ('Width', 1, 'f'),
+    b'KP2N': ('Length', 1, 'f'),
+    b'KP2V': ('Visibility', 1, 'f'),
+    b'KRHA': ('HeightAbove', 1, 'f'),
+    b'KRHB': ('HeightBelow', 1, 'f'),
+    b'KRAL': ('Alpha', 1, 'f'),
+    b'KRCO': ('Color', 3, 'f'),
+    b'KRTX': ('TextureSlot', 1, 'i'),
+    b'KRVS': ('Visibility', 1, 'f'),
+    b'KCTR': ('Translation', 3, 'f'),
+    b'KCRL': ('Rotation', 1, 'f'),
+    b'KTTR': ('Translation', 3, 'f'),
+}
+
+interpolation_names = ('DontInterp', 'Linear', 'Hermite', 'Bezier')
+
+filter_mode_names = {value: key for key, value in mdx_filter_mode_ids.items()}
+
+particle_filter_mode_names = ('Blend', 'Additive', 'Modulate', 'Modulate2x', 'Transparent')
+
+light_type_names = ('Omnidirectional', 'Directional', 'Ambient')
+
+def group(values, n):
+    # Splits a flat sequence into n-tuples
+    return list(zip(*[iter(values)] * n))
+
+class MDXParser:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        self.offset = 0
+        self.version = 800
+
+    def close(self):
+        # Arrays are copied out of the mapping, so nothing should still reference it. Should a view outlive
+        # the parse anyway, the mapping is left to the garbage collector rather than raising over the parse error.
+        try:
+            self.view.release()
+            self.data.close()
+        except BufferError:
+            pass
+        finally:
+            self.file.close()
+
+    def read(self, fmt):
+        values = struct.unpack_from('<' + fmt, self.data, self.offset)
+        self.offset += struct.calcsize('<' + fmt)
+        return values
+
+    def read_tag(self):
+        tag = self.data[self.offset:self.offset + 4]
+        self.offset += 4
+        return tag
+
+    def peek_tag(self):
+        return self.data[self.offset:self.offset + 4]
+
+    def read_string(self, size):
+        value = self.data[self.offset:self.offset + size].split(b'\0', 1)[0].decode('utf-8', 'replace')
+        self.offset += size
+        return value
+
+    def read_array(self, typecode, count):
+        # Copies the values out of the mapped file in one go, so the result doesn't pin the mapping
+        values = array(typecode)
+        size = values.itemsize * count
+        if self.offset + size > len(self.data):
+            raise ValueError("Unexpected end of file at offset %d" % self.offset)
+        with self.view[self.offset:self.offset + size] as view:
+            values.frombytes(view)
+        self.offset += size
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def read_inclusive(self):
+        # Returns the end offset of a block whose size includes the size field itself
+        start = self.offset
+        size, = self.read('I')
+        return start + size
+
+    def read_track(self, tag):
+        type, n, typecode = track_types[tag]
+
+        curve = War3AnimationCurve()
+        curve.type = type
+
+        count, interpolation, global_sequence = self.read('IIi')
+        curve.interpolation = interpolation_names[interpolation]
+        curve.global_sequence = global_sequence
+
+        has_tangents = interpolation > 1
+        stride = n * 3 if has_tangents else n
+        times = []
+        keys = []
+        in_tans = []
+        out_tans = []
+        for i in range(count):
+            frame, = self.read('i')
+            values = self.read('%d%s' % (stride, typecode))
+
+            key = values[:n]
+            if type == 'Rotation' and n == 4:
+                # Blender quaternions have the form WXYZ, while MDX has XYZW
+                key = (key[3], key[0], key[1], key[2])
+            times.append(frame)
+            keys.append(key)
+
+            if has_tangents:
+                in_tan = values[n:2*n]
+                out_tan = values[2*n:]
+
+                if type == 'Rotation' and n == 4:
+                    in_tan = (in_tan[3], in_tan[0], in_tan[1], in_tan[2])
+                    out_tan = (out_tan[3], out_tan[0], out_tan[1], out_tan[2])
+
+                in_tans.append(in_tan)
+                out_tans.append(out_tan)
+
+        if has_tangents:
+            curve.set_keys(times, keys, in_tans, out_tans)
+        else:
+            curve.set_keys(times, keys)
+        return curve
+
+    def read_tracks(self, end):
+        # Reads every track until the end of the enclosing block
+        tracks = {}
+        while self.offset < end:
+            tag = self.read_tag()
+            if tag not in track_types:
+                print("Skipping unknown track %s" % tag)
+                break
+            tracks[tag] = self.read_track(tag)
+        self.offset = end
+        return tracks
+
+    def parse_node(self, node_class):
+        end = self.read_inclusive()
+        name = self.read_string(80)
+        node = node_class(name)
+
+        object_id, parent_id, flags = self.read('IIi')
+        node.object_id = object_id
+        node.parent_id = None if parent_id == 0xFFFFFFFF else parent_id
+        node.billboarded = bool(flags & 0x8)
+        node.billboard_lock = (bool(flags & 0x10), bool(flags & 0x20), bool(flags & 0x40))
+
+        tracks = self.read_tracks(end)
+        node.anim_loc = tracks.get(b'KGTR')
+        node.anim_rot = tracks.get(b'KGRT')
+        node.anim_scale = tracks.get(b'KGSC')
+
+        return node, flags
+
+    def parse_version(self, end):
+        self.version, = self.read('I')
+
+    def parse_model(self, end):
+        self.model.name = self.read_string(80)
+
+    def parse_sequences(self, end):
+        count = (end - self.offset) // 132
+        print("Parsing %d sequences" % count)
+        for i in range(count):
+            name = self.read_string(80)
+            start, end_frame, movement_speed, flags, rarity, sync_point = self.read('IIfIfI')
+            self.read('7f') # Extent
+
+            sequence = War3AnimationSequence(name, start, end_frame, bool(flags & 0x1), movement_speed)
+            sequence.rarity = rarity
+
+            self.model.sequences.append(sequence)
+
+    def parse_global_sequences(self, end):
+        print("Parsing global sequences")
+        for duration in self.read_array('I', (end - self.offset) // 4):
+            self.model.global_seqs.add(duration)
+
+    def parse_textures(self, end):
+        count = (end - self.offset) // 268
+        print("Parsing %d textures" % count)
+        for i in range(count):
+            replaceable_id, = self.read('I')
+            texture = War3Texture(self.read_string(260))
+            self.read('I') # Flags
+
+            if replaceable_id != 0:
+                texture.image_path = None
+                texture.is_replaceable = True
+                texture.replaceable_id = replaceable_id
+
+            self.model.textures.append(texture)
+
+    def parse_materials(self, end):
+        while self.offset < end:
+            material = War3Material("Material %d" % len(self.model.materials))
+            material_end = self.read_inclusive()
+            material.priority_plane, flags = self.read('iI')
+            material.use_const_color = bool(flags & 0x1)
+
+            self.read_tag() # LAYS
+            layer_count, = self.read('I')
+            for i in range(layer_count):
+                layer = War3MaterialLayer()
+                layer_end = self.read_inclusive()
+                filter_mode, flags, texture_id, texture_anim_id, coord_id, alpha = self.read('IIIIIf')
+
+                layer.filter_mode = filter_mode_names.get(filter_mode, 'None')
+                layer.unshaded = bool(flags & 0x1)
+                layer.two_sided = bool(flags & 0x10)
+                layer.unfogged = bool(flags & 0x20)
+                layer.no_depth_test = bool(flags & 0x40)
+                layer.no_depth_set = bool(flags & 0x80)
+                layer.texture_id = texture_id
+                layer.texture_anim_id = None if texture_anim_id == 0xFFFFFFFF else texture_anim_id
+                layer.alpha_value = alpha
+
+                tracks = self.read_tracks(layer_end)
+                layer.alpha_anim = tracks.get(b'KMTA')
+                layer.texture_id_anim = tracks.get(b'KMTF')
+
+                material.layers.append(layer)
+
+            self.offset = material_end
+            self.model.materials.append(material)
+
+    def parse_texture_anims(self, end):
+        while self.offset < end:
+            War3TextureAnim.read_mdx(self.model, self)
+
+    def parse_geosets(self, end):
+        while self.offset < end:
+            print("Parsing geoset")
+            geoset = War3Geoset()
+            geoset_end = self.read_inclusive()
+
+            matrix_sizes = matrix_indices = ()
+
+            while self.offset < geoset_end:
+                tag = self.read_tag()
+                count, = self.read('I')
+                if tag == b'VRTX':
+                    print("Parsing %d vertices" % count)
+                    geoset.positions = self.read_array('f', count * 3)
+                elif tag == b'NRMS':
+                    geoset.normals = self.read_array('f', count * 3)
+                elif tag == b'PTYP':
+                    self.read_array('I', count) # Only triangles are supported
+                elif tag == b'PCNT':
+                    self.read_array('I', count)
+                elif tag == b'PVTX':
+                    print("Parsing triangles")
+                    geoset.triangles = array('i', self.read_array('H', count))
+                elif tag == b'GNDX':
+                    geoset.groups = array('i', self.read_array('B', count))
+                elif tag == b'MTGC':
+                    matrix_sizes = self.read_array('I', count)
+                elif tag == b'MATS':
+                    matrix_indices = self.read_array('I', count)
+                    geoset.material_id, selection_group, selection_flags = self.read('III')
+                    self.read('7f') # Extent
+                    extent_count, = self.read('I')
+                    self.offset += extent_count * 28
+                elif tag == b'UVAS':
+                    pass # The count is the number of UVBS chunks that follow
+                elif tag == b'UVBS':
+                    layer = self.read_array('f', count * 2)
+                    if not len(geoset.uvs): # Only the first UV set is used
+                        geoset.uvs = layer
+                else:
+                    print("Unknown geoset chunk %s" % tag)
+                    break
+
+            self.offset = geoset_end
+
+            i = 0
+            for size in matrix_sizes:
+                geoset.matrices.append(tuple(matrix_indices[i:i + size]))
+                i += size
+
+            self.model.geosets.append(geoset)
+
+    def parse_geoset_anims(self, end):
+        while self.offset < end:
+            print("Parsing geoset animation")
+            anim_end = self.read_inclusive()
+            alpha, flags, b, g, r, geoset_id = self.read('fI3fI')
+
+            geoset_anim = War3GeosetAnim((b, g, r), None, None) # Color is stored as BGR, same as in MDL
+            geoset_anim.alpha = alpha
+            geoset_anim.geoset_id = geoset_id
+
+            tracks = self.read_tracks(anim_end)
+            geoset_anim.alpha_anim = tracks.get(b'KGAO')
+            geoset_anim.color_anim = tracks.get(b'KGAC')
+
+            self.model.geoset_anims.append(geoset_anim)
+
+    def parse_bones(self, end):
+        while self.offset < end:
+            bone, flags = self.parse_node(War3Bone)
+            print("Parsing bone %s" % bone.name)
+            bone.geoset_id, geoset_anim_id = self.read('ii')
+            bone.geoset_anim_id = None if geoset_anim_id == -1 else geoset_anim_id
+
+            self.model.objects['bone'].add(bone)
+
+    def parse_lights(self, end):
+        while self.offset < end:
+            light_end = self.read_inclusive()
+            light, flags = self.parse_node(War3Light)
+            type, light.atten_start, light.atten_end = self.read('Iff')
+            light.type = light_type_names[type]
+            *light.color, light.intensity = self.read('3ff')
+            *light.amb_color, light.amb_intensity = self.read('3ff')
+            light.color = tuple(light.color)
+            light.amb_color = tuple(light.amb_color)
+
+            tracks = self.read_tracks(light_end)
+            light.atten_start_anim = tracks.get(b'KLAS')
+            light.atten_end_anim = tracks.get(b'KLAE')
+            light.color_anim = tracks.get(b'KLAC')
+            light.intensity_anim = tracks.get(b'KLAI')
+            light.amb_intensity_anim = tracks.get(b'KLBI')
+            light.amb_color_anim = tracks.get(b'KLBC')
+            light.visibility = tracks.get(b'KLAV')
+
+            self.model.objects['light'].add(light)
+
+    def parse_helpers(self, end):
+        while self.offset < end:
+            helper, flags = self.parse_node(War3Object)
+            print("Parsing helper %s" % helper.name)
+            self.model.objects['helper'].add(helper)
+
+    def parse_attachments(self, end):
+        while self.offset < end:
+            attachment_end = self.read_inclusive()
+            attachment, flags = self.parse_node(War3Object)
+            print("Parsing attachment %s" % attachment.name)
+            self.read_string(260) # Path
+            attachment.attachment_id, = self.read('I')
+            attachment.visibility = self.read_tracks(attachment_end).get(b'KATV')
+
+            self.model.objects['attachment'].add(attachment)
+
+    def parse_pivot_points(self, end):
+        count = (end - self.offset) // 12
+        print("Parsing %d pivot points" % count)
+        self.model.pivots = group(self.read_array('f', count * 3), 3)
+
+    def parse_particle_emitters_2(self, end):
+        while self.offset < end:
+            emitter_end = self.read_inclusive()
+            emitter, flags = self.parse_node(War3ParticleSystem)
+            print("Parsing ParticleEmitter2 %s" % emitter.name)
+
+            emitter.unshaded = bool(flags & 0x8000)
+            emitter.sort_far_z = bool(flags & 0x10000)
+            emitter.line_emitter = bool(flags & 0x20000)
+            emitter.unfogged = bool(flags & 0x40000)
+            emitter.model_space = bool(flags & 0x80000)
+            emitter.xy_quad = bool(flags & 0x100000)
+
+            (emitter.speed, emitter.variation, emitter.latitude, emitter.gravity,
+             emitter.life_span, emitter.emission_rate, emitter.width, emitter.height) = self.read('8f')
+
+            filter_mode, emitter.rows, emitter.cols, head_or_tail, emitter.tail_length, emitter.time = self.read('4I2f')
+            emitter.filter_mode = particle_filter_mode_names[filter_mode]
+            emitter.head = head_or_tail in {0, 2}
+            emitter.tail = head_or_tail in {1, 2}
+
+            colors = self.read('9f')
+            emitter.start_color = colors[0:3]
+            emitter.mid_color = colors[3:6]
+            emitter.end_color = colors[6:9]
+            emitter.start_alpha, emitter.mid_alpha, emitter.end_alpha = self.read('3B')
+            emitter.start_scale, emitter.mid_scale, emitter.end_scale = self.read('3f')
+
+            (emitter.head_life_start, emitter.head_life_end, emitter.head_life_repeat,
+             emitter.head_decay_start, emitter.head_decay_end, emitter.head_decay_repeat,
+             emitter.tail_life_start, emitter.tail_life_end, emitter.tail_life_repeat,
+             emitter.tail_decay_start, emitter.tail_decay_end, emitter.tail_decay_repeat) = self.read('12I')
+
+            emitter.texture_id, squirt, emitter.priority_plane, replaceable_id = self.read('iiiI')
+
+            tracks = self.read_tracks(emitter_end)
+            emitter.speed_anim = tracks.get(b'KP2S')
+            emitter.variation_anim = tracks.get(b'KP2R')
+            emitter.latitude_anim = tracks.get(b'KP2L')
+            emitter.gravity_anim = tracks.get(b'KP2G')
+            emitter.emission_rate_anim = tracks.get(b'KP2E')
+            emitter.width_anim = tracks.get(b'KP2W')
+            emitter.height_anim = tracks.get(b'KP2N')
+            emitter.visibility = tracks.get(b'KP2V')
+
+            self.model.objects['particle2'].add(emitter)
+
+    def parse_cameras(self, end):
+        while self.offset < end:
+            camera_end = self.read_inclusive()
+            camera = War3Camera(self.read_string(80))
+            print("Parsing camera %s" % camera.name)
+            camera.pivot = self.read('3f')
+            camera.field_of_view, camera.far_clip, camera.near_clip = self.read('3f')
+            camera.target = self.read('3f')
+            self.offset = camera_end
+
+            self.model.objects['camera'].add(camera)
+
+    def parse_event_objects(self, end):
+        while self.offset < end:
+            event, flags = self.parse_node(War3EventObject)
+            print("Parsing event object %s" % event.name)
+            event.track = None
+
+            if self.offset < end and self.peek_tag() == b'KEVT':
+                self.read_tag()
+                count, global_sequence = self.read('Ii')
+
+                curve = War3AnimationCurve()
+                curve.type = 'EventTrack'
+                curve.global_sequence = global_sequence
+                times = self.read_array('I', count)
+                curve.set_keys(times, [(1,)] * len(times))
+                event.track = curve
+
+            self.model.objects['eventobject'].add(event)
+
+    def parse_collision_shapes(self, end):
+        while self.offset < end:
+            shape, flags = self.parse_node(War3CollisionShape)
+            print("Parsing collision shape %s" % shape.name)
+            type, = self.read('I')
+            if type == 2:
+                shape.type = 'Sphere'
+                shape.vertices = [self.read('3f')]
+                shape.radius, = self.read('f')
+            else:
+                # Planes and cylinders are imported as boxes
+                shape.type = 'Box'
+                shape.vertices = [self.read('3f'), self.read('3f')]
+                if type == 3:
+                    self.read('f')
+
+            self.model.objects['collisionshape'].add(shape)
+
+    def parse(self, model):
+        self.model = model
+
+        if self.read_tag() != b'MDLX':
+            raise ValueError("Not an MDX file")
+
+        handlers = {
+            b'VERS': self.parse_version,
+            b'MODL': self.parse_model,
+            b'SEQS': self.parse_sequences,
+            b'GLBS': self.parse_global_sequences,
+            b'MTLS': self.parse_materials,
+            b'TEXS': self.parse_textures,
+            b'TXAN': self.parse_texture_anims,
+            b'GEOS': self.parse_geosets,
+            b'GEOA': self.parse_geoset_anims,
+            b'BONE': self.parse_bones,
+            b'LITE': self.parse_lights,
+            b'HELP': self.parse_helpers,
+            b'ATCH': self.parse_attachments,
+            b'PIVT': self.parse_pivot_points,
+            b'PRE2': self.parse_particle_emitters_2,
+            b'CAMS': self.parse_cameras,
+            b'EVTS': self.parse_event_objects,
+            b'CLID': self.parse_collision_shapes,
+        }
+
+        while self.offset < len(self.data):
+            tag = self.read_tag()
+            size, = self.read('I')
+            end = self.offset + size
+
+            handler = handlers.get(tag)
+            if handler is not None:
+                handler(end)
+            self.offset = end
+
+            if self.version != 800:
+                return # Later versions change the geoset and material layouts
+
+def load(operator, context, settings, filepath=""):
+    print("Beginning load of model %s" % filepath)
+    model = War3Model(context)
+    parser = MDXParser(filepath)
+
+    print("Parsing...")
+    try:
+        parser.parse(model)
+    finally:
+        parser.close()
+
+    if parser.version != 800:
+        operator.report({'ERROR'}, "MDX version %d is not supported." % parser.version)
+        return
+
+    print("Converting to scene...")
+    model.to_scene(context, settings.global_matrix, os.path.dirname(filepath), settings.convert_to_quads)
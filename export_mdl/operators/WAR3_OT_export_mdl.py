@@ -55,6 +55,12 @@ class WAR3_OT_export_mdl(Operator, ExportHelper):
             subtype='DISTANCE',
             unit='LENGTH'
             )
+            
+    optimize_bezier : BoolProperty(
+            name="Fit Bezier Curves",
+            description="Keep Bezier interpolation when optimizing, fitting new tangents within the tolerance instead of converting to linear",
+            default=False,
+            )
     
     def execute(self, context):                                   
         filepath = self.filepath
@@ -68,6 +74,7 @@ class WAR3_OT_export_mdl(Operator, ExportHelper):
         settings.use_selection = self.use_selection
         settings.optimize_animation = self.optimize_animation
         settings.optimize_tolerance = self.optimize_tolerance
+        settings.optimize_bezier = self.optimize_bezier
         
         from .. import export_mdl
         export_mdl.save(self, context, settings, filepath=filepath, mdl_version=800)
@@ -86,4 +93,5 @@ class WAR3_OT_export_mdl(Operator, ExportHelper):
         if self.optimize_animation:
             box = layout.box()
             box.label(text="EXPERIMENTAL", icon='ERROR')
-            layout.prop(self, 'optimize_tolerance')
\ No newline at end of file
+            layout.prop(self, 'optimize_tolerance')
+            layout.prop(self, 'optimize_bezier')
\ No newline at end of file
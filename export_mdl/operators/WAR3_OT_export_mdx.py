@@ -0,0 +1,95 @@
+import bpy
+
+from bpy.types import Operator
+from bpy.props import FloatProperty, BoolProperty, StringProperty
+
+from bpy_extras.io_utils import (
+        ExportHelper,
+        axis_conversion,
+        orientation_helper,
+        )
+        
+from mathutils import Matrix
+
+from ..classes.War3ExportSettings import War3ExportSettings
+
+@orientation_helper(axis_forward='-X', axis_up='Z')
+class WAR3_OT_export_mdx(Operator, ExportHelper):
+    """MDX Exporter"""
+    bl_idname = 'export.mdx_exporter'
+    bl_description = 'Warcraft 3 MDX Exporter'
+    bl_label = 'Export .MDX'
+    filename_ext = ".mdx"
+    
+    filter_glob : StringProperty(
+            default="*.mdx", options={'HIDDEN'}
+            )
+    
+    filepath : StringProperty(
+            subtype="FILE_PATH"
+            )
+    
+    use_selection : BoolProperty(
+            name="Selected Objects",
+            description="Export only selected objects on visible layers",
+            default=False,
+            )
+            
+    global_scale : FloatProperty(
+            name="Scale",
+            min=0.01, 
+            max=1000.0,
+            default=60.0,
+            )
+            
+    optimize_animation : BoolProperty(
+            name="Optimize Keyframes",
+            description="Remove keyframes if the resulting motion deviates less than the tolerance value."
+            )
+            
+    optimize_tolerance : FloatProperty(
+            name="Tolerance",
+            min=0.001, 
+            soft_max=0.1,
+            default=0.05,
+            subtype='DISTANCE',
+            unit='LENGTH'
+            )
+            
+    optimize_bezier : BoolProperty(
+            name="Fit Bezier Curves",
+            description="Keep Bezier interpolation when optimizing, fitting new tangents within the tolerance instead of converting to linear",
+            default=False,
+            )
+    
+    def execute(self, context):                                   
+        filepath = self.filepath
+        filepath = bpy.path.ensure_ext(filepath, self.filename_ext)
+        
+        settings = War3ExportSettings()
+        settings.global_matrix = axis_conversion(to_forward=self.axis_forward,
+                                 to_up=self.axis_up,
+                                 ).to_4x4() @ Matrix.Scale(self.global_scale, 4)
+                                 
+        settings.use_selection = self.use_selection
+        settings.optimize_animation = self.optimize_animation
+        settings.optimize_tolerance = self.optimize_tolerance
+        settings.optimize_bezier = self.optimize_bezier
+        
+        from .. import export_mdx
+        return export_mdx.save(self, context, settings, filepath=filepath, mdx_version=800)
+       
+    def draw(self, context):
+        layout = self.layout
+        
+        layout.prop(self, "use_selection")
+        layout.prop(self, "global_scale")
+        layout.prop(self, "axis_forward")
+        layout.prop(self, "axis_up")
+        layout.separator()
+        layout.prop(self, 'optimize_animation')
+        if self.optimize_animation:
+            box = layout.box()
+            box.label(text="EXPERIMENTAL", icon='ERROR')
+            layout.prop(self, 'optimize_tolerance')
+            layout.prop(self, 'optimize_bezier')
\ No newline at end of file
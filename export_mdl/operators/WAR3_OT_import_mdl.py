@@ -1,6 +1,6 @@
 import bpy
 from bpy.types import Operator
-from bpy.props import FloatProperty, StringProperty
+from bpy.props import FloatProperty, BoolProperty, StringProperty
 from bpy_extras.io_utils import ImportHelper, axis_conversion
 
 from mathutils import Matrix
@@ -30,6 +30,12 @@ class WAR3_OT_import_mdl(Operator, ImportHelper):
             default=0.016,
             )
 
+    convert_to_quads : BoolProperty(
+            name="Convert to Quads",
+            description="Join triangles into quads where possible",
+            default=True,
+            )
+
     def execute(self, context):
         filepath = self.filepath
         filepath = bpy.path.ensure_ext(filepath, self.filename_ext)
@@ -39,6 +45,7 @@ class WAR3_OT_import_mdl(Operator, ImportHelper):
         settings.global_matrix = axis_conversion(to_forward='-X',
                                  to_up='Z',
                                  ).to_4x4().inverted() @ Matrix.Scale(self.global_scale, 4)
+        settings.convert_to_quads = self.convert_to_quads
 
         from .. import import_mdl
         import_mdl.load(self, context, settings, filepath=filepath)
@@ -46,4 +53,7 @@ class WAR3_OT_import_mdl(Operator, ImportHelper):
         return {'FINISHED'}
 
     def draw(self, context):
-        pass
\ No newline at end of file
+        layout = self.layout
+
+        layout.prop(self, "global_scale")
+        layout.prop(self, "convert_to_quads")
\ No newline at end of file
@@ -0,0 +1,59 @@
+import bpy
+from bpy.types import Operator
+from bpy.props import FloatProperty, BoolProperty, StringProperty
+from bpy_extras.io_utils import ImportHelper, axis_conversion
+
+from mathutils import Matrix
+
+from ..classes.War3ImportSettings import War3ImportSettings 
+
+class WAR3_OT_import_mdx(Operator, ImportHelper):
+    """MDX Importer"""
+    bl_idname = 'import.mdx_importer'
+    bl_description = 'Warcraft 3 MDX Importer'
+    bl_label = 'Import .MDX'
+    filename_ext = '.mdx'
+
+    filter_glob : StringProperty(
+        default="*.mdx", options={'HIDDEN'}
+        )
+    
+    filepath : StringProperty(
+            subtype="FILE_PATH"
+            )
+
+    global_scale : FloatProperty(
+            name="Import scale",
+            description="Warcraft models use different units, and need to be scaled down by about a factor of 60",
+            min=0.001, 
+            max=100.0,
+            default=0.016,
+            )
+
+    convert_to_quads : BoolProperty(
+            name="Convert to Quads",
+            description="Join triangles into quads where possible",
+            default=True,
+            )
+
+    def execute(self, context):
+        filepath = self.filepath
+        filepath = bpy.path.ensure_ext(filepath, self.filename_ext)
+
+        settings = War3ImportSettings()
+        settings.global_matrix = Matrix.Scale(self.global_scale, 4)
+        settings.global_matrix = axis_conversion(to_forward='-X',
+                                 to_up='Z',
+                                 ).to_4x4().inverted() @ Matrix.Scale(self.global_scale, 4)
+        settings.convert_to_quads = self.convert_to_quads
+
+        from .. import import_mdx
+        import_mdx.load(self, context, settings, filepath=filepath)
+
+        return {'FINISHED'}
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.prop(self, "global_scale")
+        layout.prop(self, "convert_to_quads")
\ No newline at end of file
@@ -5,7 +5,9 @@ if "bpy" in locals():
     importlib.reload(WAR3_OT_create_eventobject)
     importlib.reload(WAR3_OT_emitter_preset_add)
     importlib.reload(WAR3_OT_export_mdl)
+    importlib.reload(WAR3_OT_export_mdx)
     importlib.reload(WAR3_OT_import_mdl)
+    importlib.reload(WAR3_OT_import_mdx)
     importlib.reload(WAR3_OT_material_list_action)
     importlib.reload(WAR3_OT_search_event_id)
     importlib.reload(WAR3_OT_search_event_type)
@@ -16,7 +18,9 @@ else:
     from . import WAR3_OT_create_eventobject
     from . import WAR3_OT_emitter_preset_add
     from . import WAR3_OT_export_mdl
+    from . import WAR3_OT_export_mdx
     from . import WAR3_OT_import_mdl
+    from . import WAR3_OT_import_mdx
     from . import WAR3_OT_material_list_action
     from . import WAR3_OT_search_event_id
     from . import WAR3_OT_search_event_type
@@ -30,7 +34,9 @@ classes = [
     WAR3_OT_create_eventobject.WAR3_OT_create_eventobject,
     WAR3_OT_emitter_preset_add.WAR3_OT_emitter_preset_add,
     WAR3_OT_export_mdl.WAR3_OT_export_mdl,
+    WAR3_OT_export_mdx.WAR3_OT_export_mdx,
     WAR3_OT_import_mdl.WAR3_OT_import_mdl,
+    WAR3_OT_import_mdx.WAR3_OT_import_mdx,
     WAR3_OT_material_list_action.WAR3_OT_material_list_action,
     WAR3_OT_search_event_id.WAR3_OT_search_event_id,
     WAR3_OT_search_event_type.WAR3_OT_search_event_type,
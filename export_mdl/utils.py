@@ -2,6 +2,11 @@ import bpy
 import math
 from operator import itemgetter
 
+try:
+    import numpy as np
+except ImportError:
+    np = None # Bulk code paths fall back to plain Python
+
 decimal_places = 5
 
 def rnd(val):
@@ -10,6 +15,25 @@ def rnd(val):
 def f2s(value):
     return ('%.6f' % value).rstrip('0').rstrip('.')
     
+def format_vectors(vectors):
+    # Formats a list of equally sized float tuples as MDL vectors, e.g. "{1, 0.5, 0}".
+    if not len(vectors):
+        return []
+    if np is None:
+        return ["{%s}" % ", ".join(map(f2s, v)) for v in vectors]
+        
+    # Same output as f2s, but the float formatting runs over the whole array at once
+    values = np.char.rstrip(np.char.rstrip(np.char.mod('%.6f', np.asarray(vectors, dtype=np.float64)), '0'), '.')
+    line = "{%s}" % ", ".join(["%s"] * values.shape[1])
+    return [line % tuple(v) for v in values.tolist()]
+    
+def index_table(items):
+    # item -> position of the first equal item, the dict version of list.index
+    table = {}
+    for i, item in enumerate(items):
+        table.setdefault(item, i)
+    return table
+    
 def calc_bounds_radius(min_ext, max_ext):
     x = (max_ext[0] - min_ext[0])/2
     y = (max_ext[1] - min_ext[1])/2
@@ -0,0 +1,165 @@
+# The tests need Blender's Python, with the add-on imported from this checkout:
+#
+#   blender -b --factory-startup --python-expr "import pytest, sys; sys.exit(pytest.main(['tests']))"
+
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import bpy
+    import bmesh
+except ImportError:
+    bpy = None # Outside Blender every test module skips itself, so the fixtures below are never used
+else:
+    import export_mdl
+
+    from export_mdl import export_mdl as mdl_writer, export_mdx as mdx_writer
+    from export_mdl.classes.War3Model import War3Model
+    from export_mdl.classes.War3ExportSettings import War3ExportSettings
+
+class Reporter:
+    # Stands in for the operator the export functions report to
+    def __init__(self):
+        self.reports = []
+
+    def report(self, type, message):
+        self.reports.append((type, message))
+
+def add_sequence(scene, name, start, end):
+    scene.timeline_markers.new(name, frame=start)
+    scene.timeline_markers.new(name, frame=end)
+    if name not in scene.mdl_sequences:
+        scene.mdl_sequences.add().name = name
+
+def add_empty(scene, name, location, parent=None):
+    obj = bpy.data.objects.new(name, None)
+    obj.location = location
+    obj.parent = parent
+    scene.collection.objects.link(obj)
+    return obj
+
+def add_cube(scene, name, material, parent):
+    mesh = bpy.data.meshes.new(name)
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=1.0)
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.uv_layers.new(name="UV")
+    mesh.materials.append(material)
+
+    obj = bpy.data.objects.new(name, mesh)
+    obj.parent = parent
+    scene.collection.objects.link(obj)
+    return obj
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    if not hasattr(bpy.types.Scene, "mdl_sequences"):
+        export_mdl.register()
+    return bpy.context.scene
+
+def build_model(reporter=None):
+    model = War3Model(bpy.context)
+    model.from_scene(bpy.context, War3ExportSettings(), (reporter or Reporter()).report)
+    return model
+
+def build_scene():
+    # A cube skinned to an animated bone, which has a child bone, with two sequences and one textured material
+    scene = reset_scene()
+    add_sequence(scene, "Stand", 0, 30)
+    add_sequence(scene, "Walk", 40, 70)
+
+    root = add_empty(scene, "Bone_Root", (0, 0, 0))
+    for frame, location in ((0, (0, 0, 0)), (30, (0, 0, 1)), (40, (0, 0, 0)), (70, (1, 0, 0))):
+        root.location = location
+        root.keyframe_insert("location", frame=frame)
+    add_empty(scene, "Bone_Arm", (1, 0, 1), root)
+
+    material = bpy.data.materials.new("Skin")
+    material.priority_plane = 1
+    layer = material.mdl_layers.add()
+    layer.path = "Textures\\Skin.blp"
+    layer.filter_mode = 'Blend'
+    layer.alpha = 0.5
+    add_cube(scene, "Body", material, root)
+
+    scene.frame_set(0)
+    bpy.context.view_layer.update()
+
+@pytest.fixture(scope="session")
+def exported(tmp_path_factory):
+    # The model built from the test scene, and the MDL and MDX files written from it
+    build_scene()
+    reporter = Reporter()
+    model = build_model(reporter)
+
+    folder = tmp_path_factory.mktemp("export")
+    mdl_path = str(folder / "model.mdl")
+    mdx_path = str(folder / "model.mdx")
+    mdl_writer.write_model(model, mdl_path)
+    mdx_writer.write_model(model, mdx_path)
+
+    return types.SimpleNamespace(model=model, reports=reporter.reports, mdl_path=mdl_path, mdx_path=mdx_path)
+
+def add_mapped_material(name, action=None):
+    # A material whose layer drives the Location of a Mapping node, keyed by a new action unless one is given
+    material = bpy.data.materials.new(name)
+    material.use_nodes = True
+    mapping = material.node_tree.nodes.new('ShaderNodeMapping')
+    layer = material.mdl_layers.add()
+    layer.name = mapping.name
+    layer.path = "Textures\\Water.blp"
+
+    if action is None:
+        location = mapping.inputs[1]
+        for frame, x in ((0, 0), (10, 1), (20, 1), (30, 1)):
+            location.default_value[0] = x
+            location.keyframe_insert("default_value", frame=frame)
+        action = material.node_tree.animation_data.action
+        for fcurve in action.fcurves:
+            for keyframe in fcurve.keyframe_points:
+                keyframe.interpolation = 'LINEAR'
+    else:
+        material.node_tree.animation_data_create().action = action
+    return material, action
+
+@pytest.fixture
+def shared_texture_anim_model():
+    # Two materials whose node trees share one action, so their layers get equal texture anims
+    scene = reset_scene()
+    add_sequence(scene, "Stand", 0, 30)
+    add_sequence(scene, "Walk", 40, 70)
+
+    root = add_empty(scene, "Bone_Root", (0, 0, 0))
+    left, action = add_mapped_material("Left")
+    right, action = add_mapped_material("Right", action)
+    add_cube(scene, "Left", left, root)
+    add_cube(scene, "Right", right, root)
+
+    scene.frame_set(0)
+    bpy.context.view_layer.update()
+    return build_model()
+
+@pytest.fixture
+def stretched_cube():
+    # A smooth shaded cube that is rotated and stretched along one axis, under a bone
+    scene = reset_scene()
+    add_sequence(scene, "Stand", 0, 30)
+
+    root = add_empty(scene, "Bone_Root", (0, 0, 0))
+    material = bpy.data.materials.new("Skin")
+    material.mdl_layers.add().path = "Textures\\Skin.blp"
+    obj = add_cube(scene, "Body", material, root)
+    obj.rotation_euler = (0.3, 0.2, 0.1)
+    obj.scale = (1, 3, 0.5)
+    for polygon in obj.data.polygons:
+        polygon.use_smooth = True
+
+    scene.frame_set(0)
+    bpy.context.view_layer.update()
+    return obj
@@ -0,0 +1,77 @@
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+from export_mdl.classes.War3AnimationCurve import War3AnimationCurve
+from export_mdl.classes.War3AnimationSequence import War3AnimationSequence, War3SequenceList
+
+f2ms = 1000 / 30
+
+def make_curve(frames, keys, interpolation='Linear', type='Translation', in_tans=None, out_tans=None):
+    curve = War3AnimationCurve()
+    curve.type = type
+    curve.interpolation = interpolation
+    curve.set_keys([int(frame * f2ms) for frame in frames], keys, in_tans, out_tans)
+    return curve
+
+def sequence_list(end_frame):
+    return War3SequenceList([War3AnimationSequence("Stand", 0, end_frame * f2ms)], f2ms)
+
+def max_deviation(a, b, sequences, end_frame):
+    times = [frame * f2ms for frame in range(end_frame + 1)]
+    return max(max(abs(x - y) for x, y in zip(p, q)) for p, q in zip(a.evaluate(times, sequences), b.evaluate(times, sequences)))
+
+def test_straight_line_collapses():
+    keys = [(frame, 0, 0) for frame in range(21)]
+    curve = make_curve(range(21), keys)
+    curve.optimize(0.05, sequence_list(20))
+    assert list(curve.times) == [0, int(20 * f2ms)]
+
+def test_bezier_keeps_key_it_cant_fit():
+    # One key between the ends leaves the fitted tangents free to pass through it, while overshooting in between
+    keys = [(0, 0, 0), (100, 0, 0), (0, 0, 0)]
+    original = make_curve((0, 1, 20), keys, 'Bezier', in_tans=keys, out_tans=keys)
+    curve = make_curve((0, 1, 20), keys, 'Bezier', in_tans=keys, out_tans=keys)
+    curve.optimize(0.05, sequence_list(20), fit_bezier=True)
+    assert len(curve) == 3
+    assert max_deviation(original, curve, sequence_list(20), 20) < 0.05
+
+def test_bezier_keeps_spike_with_two_samples():
+    # Keys baked at 30 fps leave only two samples between the ends, which two tangents would fit exactly
+    keys = [(0, 0, 0), (1, 0, 0), (0, 0, 0)]
+    original = make_curve((0, 1, 2), keys, 'Bezier', in_tans=keys, out_tans=keys)
+    curve = make_curve((0, 1, 2), keys, 'Bezier', in_tans=keys, out_tans=keys)
+    curve.optimize(0.01, sequence_list(2), fit_bezier=True)
+    assert len(curve) == 3
+    assert max_deviation(original, curve, sequence_list(2), 2) < 0.01
+
+def test_bezier_fit_stays_within_tolerance():
+    def cubic(u):
+        return 30 * u * (1 - u) ** 2 - 15 * u * u * (1 - u) + 2 * u ** 3
+    step = 1 / 180
+    frames = range(61)
+    keys = [(cubic(frame / 60), 0, 0) for frame in frames]
+    in_tans = [(cubic(frame / 60 - step), 0, 0) for frame in frames]
+    out_tans = [(cubic(frame / 60 + step), 0, 0) for frame in frames]
+    original = make_curve(frames, keys, 'Bezier', in_tans=in_tans, out_tans=out_tans)
+    curve = make_curve(frames, keys, 'Bezier', in_tans=in_tans, out_tans=out_tans)
+    curve.optimize(0.05, sequence_list(60), fit_bezier=True)
+    assert len(curve) < len(original)
+    assert max_deviation(original, curve, sequence_list(60), 60) < 0.05
+
+def test_key_views_are_read_only():
+    curve = make_curve((0, 10), [(0, 0, 0), (1, 0, 0)])
+    assert dict(curve.keyframes) == {0: (0, 0, 0), int(10 * f2ms): (1, 0, 0)}
+    with pytest.raises(TypeError):
+        curve.keyframes[0] = (5, 5, 5)
+    with pytest.raises(TypeError):
+        curve.handles_left[0] = (5, 5, 5)
+
+def test_evaluate_uses_keys_of_containing_sequence():
+    curve = War3AnimationCurve()
+    curve.set_keys([0, 100, 200, 300], [(0,), (10,), (100,), (200,)])
+    sequences = War3SequenceList([War3AnimationSequence("Stand", 0, 100), War3AnimationSequence("Walk", 200, 300)], 1)
+    values = curve.evaluate([50, 150, 250], sequences, default=(-1,))
+    assert [tuple(value) for value in values] == [pytest.approx((5,)), (-1,), pytest.approx((150,))]
+    # Without sequences all keys form one span
+    assert tuple(curve.evaluate([150], None)[0]) == pytest.approx((55,))
@@ -0,0 +1,59 @@
+import itertools
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+from export_mdl.import_mdl import MDLParser
+from export_mdl.classes.War3Model import War3Model
+
+# VertexGroup has no count of its own and comes before Vertices here, so it can't be sized from the positions
+vertex_groups_first = """Version {
+	FormatVersion 800,
+}
+Geoset {
+	VertexGroup {
+		0,
+		1,
+		1,
+	}
+	Vertices 3 {
+		{ 0, 0, 0 },
+		{ 1, 0, 0 },
+		{ 0, 1, 0 },
+	}
+	Faces 1 3 {
+		Triangles {
+			{ 0, 1, 2 },
+		}
+	}
+	Groups 2 2 {
+		Matrices { 0 },
+		Matrices { 1 },
+	}
+	MaterialID 0,
+}
+"""
+
+def parse(path):
+    model = War3Model(bpy.context)
+    MDLParser(path).parse(model)
+    return model
+
+def test_geoset_roundtrip(exported):
+    model = parse(exported.mdl_path)
+    source = exported.model.geosets[0]
+    geoset = model.geosets[0]
+    assert list(geoset.positions) == pytest.approx(list(itertools.chain.from_iterable(v[0] for v in source.vertices)), abs=1e-4)
+    assert list(geoset.groups) == [v[3] for v in source.vertices]
+    assert list(geoset.triangles) == list(itertools.chain.from_iterable(source.triangles))
+
+def test_vertex_group_read_to_closing_brace(tmp_path):
+    path = tmp_path / "groups.mdl"
+    path.write_text(vertex_groups_first)
+
+    geoset = parse(str(path)).geosets[0]
+    assert list(geoset.groups) == [0, 1, 1]
+    assert len(geoset.positions) == 9
+    assert list(geoset.triangles) == [0, 1, 2]
+    assert geoset.matrices == [(0,), (1,)]
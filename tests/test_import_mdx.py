@@ -0,0 +1,32 @@
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+from export_mdl.import_mdx import MDXParser
+from export_mdl.classes.War3Model import War3Model
+
+def parse(path):
+    model = War3Model(bpy.context)
+    parser = MDXParser(path)
+    try:
+        parser.parse(model)
+    finally:
+        parser.close()
+    return model
+
+def test_parsed_arrays_outlive_parser(exported):
+    # close() unmaps the file, which would fail or leave dangling data if any array still pointed into it
+    model = parse(exported.mdx_path)
+    geoset = model.geosets[0]
+    assert len(geoset.positions) == len(exported.model.geosets[0].vertices) * 3
+    assert sum(geoset.positions) == pytest.approx(sum(sum(v[0]) for v in exported.model.geosets[0].vertices), abs=1e-4)
+    assert len(model.pivots) == len(exported.model.objects_all)
+
+def test_truncated_file_reports_parse_error(exported, tmp_path):
+    with open(exported.mdx_path, 'rb') as file:
+        data = file.read()
+    path = tmp_path / "truncated.mdx"
+    path.write_bytes(data[:data.index(b'VRTX') + 40]) # Cut inside the vertex array
+
+    with pytest.raises(ValueError, match="Unexpected end of file"):
+        parse(str(path))
@@ -0,0 +1,81 @@
+import itertools
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+from export_mdl.export_mdx import bone_name
+from export_mdl.import_mdx import MDXParser
+from export_mdl.classes.War3Model import War3Model
+
+def flatten(vectors):
+    return list(itertools.chain.from_iterable(vectors))
+
+@pytest.fixture(scope="module")
+def parsed(exported):
+    model = War3Model(bpy.context)
+    parser = MDXParser(exported.mdx_path)
+    try:
+        parser.parse(model)
+    finally:
+        parser.close()
+    return parser, model
+
+def test_version(parsed):
+    parser, model = parsed
+    assert parser.version == 800
+
+def test_sequences(exported, parsed):
+    parser, model = parsed
+    assert [s.name for s in model.sequences] == [s.name for s in exported.model.sequences]
+    for sequence, source in zip(model.sequences, exported.model.sequences):
+        assert (sequence.start, sequence.end) == (int(source.start), int(source.end))
+        assert sequence.non_looping == source.non_looping
+        assert sequence.rarity == source.rarity
+        assert sequence.movement_speed == (source.movement_speed if 'walk' in source.name.lower() else 0)
+
+def test_materials(exported, parsed):
+    parser, model = parsed
+    assert len(model.materials) == len(exported.model.materials)
+    for material, source in zip(model.materials, exported.model.materials):
+        assert material.priority_plane == source.priority_plane
+        assert material.use_const_color == source.use_const_color
+        assert len(material.layers) == len(source.layers)
+        for layer, source_layer in zip(material.layers, source.layers):
+            assert layer.filter_mode == source_layer.filter_mode
+            assert layer.texture_id == source_layer.texture_id
+            assert layer.alpha_value == pytest.approx(source_layer.alpha_value)
+            assert (layer.unshaded, layer.two_sided) == (source_layer.unshaded, source_layer.two_sided)
+
+def test_geosets(exported, parsed):
+    parser, model = parsed
+    source_model = exported.model
+    assert len(model.geosets) == len(source_model.geosets)
+    for geoset, source in zip(model.geosets, source_model.geosets):
+        assert list(geoset.positions) == pytest.approx(flatten(v[0] for v in source.vertices), abs=1e-5)
+        assert list(geoset.normals) == pytest.approx(flatten(v[1] for v in source.vertices), abs=1e-5)
+        assert list(geoset.uvs) == pytest.approx(flatten(v[2] for v in source.vertices), abs=1e-5)
+        assert list(geoset.groups) == [v[3] for v in source.vertices]
+        assert list(geoset.triangles) == flatten(source.triangles)
+        assert geoset.matrices == [tuple(source_model.object_indices[name] for name in matrix) for matrix in source.matrices]
+        assert geoset.material_id == source_model.material_ids[source.mat_name]
+
+def test_bones(exported, parsed):
+    parser, model = parsed
+    source_model = exported.model
+    bones = {bone.name: bone for bone in model.objects['bone']}
+    assert set(bones) == {bone_name(bone.name) for bone in source_model.objects['bone']}
+    for source in source_model.objects['bone']:
+        bone = bones[bone_name(source.name)]
+        assert bone.object_id == source_model.object_indices[source.name]
+        assert bone.parent_id == (None if source.parent is None else source_model.object_indices[source.parent])
+        assert (bone.anim_loc is None) == (source.anim_loc is None)
+        if source.anim_loc is not None:
+            assert list(bone.anim_loc.times) == list(source.anim_loc.times)
+
+def test_pivots(exported, parsed):
+    parser, model = parsed
+    pivots = [tuple(object.pivot) for object in exported.model.objects_all]
+    assert len(model.pivots) == len(pivots)
+    for pivot, source in zip(model.pivots, pivots):
+        assert pivot == pytest.approx(source, abs=1e-5)
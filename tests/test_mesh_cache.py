@@ -0,0 +1,39 @@
+import importlib
+import itertools
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+from export_mdl.classes.War3Model import War3Model
+from export_mdl.classes.War3MeshCache import mesh_cache
+from export_mdl.classes.War3ExportSettings import War3ExportSettings
+
+model_module = importlib.import_module(War3Model.__module__)
+
+def flatten(vertex):
+    coord, normal, uv, matrix = vertex
+    return list(itertools.chain(coord, normal, uv))
+
+def build_geoset():
+    model = War3Model(bpy.context)
+    model.from_scene(bpy.context, War3ExportSettings(), lambda type, message: None)
+    return model.geosets[0]
+
+def test_stretched_mesh_matches_per_triangle_path(stretched_cube):
+    # Stretched objects are never cached, and keep the normals Blender computes for the transformed mesh
+    assert mesh_cache.fingerprint(stretched_cube) is None
+    geoset = build_geoset()
+
+    numpy = model_module.np
+    model_module.np = None
+    try:
+        reference = build_geoset()
+    finally:
+        model_module.np = numpy
+
+    assert len(geoset.vertices) == len(reference.vertices)
+    for vertex, expected in zip(geoset.vertices, reference.vertices):
+        assert flatten(vertex) == pytest.approx(flatten(expected), abs=1e-5)
+        assert vertex[3] == expected[3]
+    assert geoset.triangles == reference.triangles
@@ -0,0 +1,38 @@
+import pytest
+
+bpy = pytest.importorskip("bpy")
+
+from export_mdl import export_mdl as mdl_writer, export_mdx as mdx_writer
+from export_mdl.classes.War3AnimationCurve import War3AnimationCurve
+from export_mdl.classes.War3AnimationSequence import War3AnimationSequence, War3SequenceList
+from export_mdl.classes.War3Material import War3Material
+from export_mdl.classes.War3MaterialLayer import War3MaterialLayer
+from export_mdl.classes.War3Model import War3Model
+
+def test_equal_texture_anims_share_one_id(shared_texture_anim_model, tmp_path):
+    model = shared_texture_anim_model
+    layers = [layer for material in model.materials for layer in material.layers]
+    assert len(layers) == 2
+    assert len(model.tvertex_anims) == 1
+    # The track pass thinned out the shared anim for both layers, so both still resolve to it
+    assert [model.tvertex_anim_ids[layer.texture_anim] for layer in layers] == [0, 0]
+    assert len(layers[0].texture_anim.translation) == len(layers[1].texture_anim.translation) == 3
+
+    mdl_writer.write_model(model, str(tmp_path / "model.mdl"))
+    mdx_writer.write_model(model, str(tmp_path / "model.mdx"))
+
+def test_layer_alpha_kept_for_uncovered_sequences():
+    # Walk has no alpha keys and shows the static alpha, so a constant track of 1 must not replace it
+    model = War3Model(bpy.context)
+    model.sequences = War3SequenceList([War3AnimationSequence("Stand", 0, 1000), War3AnimationSequence("Walk", 2000, 3000)], 1)
+    layer = War3MaterialLayer()
+    layer.alpha_value = 0.5
+    layer.alpha_anim = War3AnimationCurve()
+    layer.alpha_anim.set_keys([0, 1000], [(1,), (1,)])
+    material = War3Material("Glass")
+    material.layers.append(layer)
+    model.materials.add(material)
+
+    model.eliminate_redundant_tracks()
+    assert layer.alpha_value == 0.5
+    assert layer.alpha_anim is not None